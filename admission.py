@@ -0,0 +1,96 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+
+from metrics import admission_wait
+from tracing import span
+
+# Resolutions allowed to run at once (0 disables admission control)
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "64"))
+
+# Requests allowed to wait for a slot; beyond this they are rejected at once
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "128"))
+
+# Longest a request waits for a slot before it is rejected (seconds)
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+
+# Retry-After (seconds) sent with rejections
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "2"))
+
+
+class Overloaded(Exception):
+    """Raised when a request can't be admitted; reason is "queue_full" or "queue_timeout"."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Server overloaded ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Caps concurrent resolutions at max_in_flight. Up to max_queue more wait
+    (first come, first served) for at most queue_timeout seconds; anything
+    else is rejected straight away, so overload sheds requests instead of
+    slowing every one of them down.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeout: float, retry_after: int):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(max_in_flight) if max_in_flight > 0 else None
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "queue_timeout": 0}
+
+    @asynccontextmanager
+    async def slot(self):
+        """Holds a slot for the duration of the block, or raises Overloaded."""
+        if self._semaphore is None:
+            yield
+            return
+
+        if self._semaphore.locked():
+            if self.queued >= self.max_queue:
+                self._reject("queue_full")
+            self.queued += 1
+            try:
+                with span("queue") as wait_span:
+                    await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self._reject("queue_timeout")
+            finally:
+                self.queued -= 1
+                admission_wait.observe(wait_span.duration)
+        else:
+            await self._semaphore.acquire()
+
+        self.admitted += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def _reject(self, reason: str):
+        self.rejected[reason] += 1
+        raise Overloaded(reason, self.retry_after)
+
+    def stats(self) -> dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+        }
+
+
+resolution_admission = AdmissionController(
+    ADMISSION_MAX_IN_FLIGHT, ADMISSION_MAX_QUEUE, ADMISSION_QUEUE_TIMEOUT, ADMISSION_RETRY_AFTER
+)
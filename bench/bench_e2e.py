@@ -0,0 +1,260 @@
+"""
+Offline end-to-end benchmark for /fetch-embed.
+
+Starts the stub upstream (bench/stub_upstream.py), seeds the proxy pool with
+live and dead stub proxies through a warm-start snapshot, runs the API with
+uvicorn pointed at the stub, and drives /fetch-embed at a fixed concurrency.
+Reports throughput, latency percentiles, success rate and upstream calls per
+request and per resolution (requests not served from cache), and optionally
+writes them as JSON so runs can be compared.
+
+    python bench/bench_e2e.py --requests 500 --concurrency 50 --latency 0.05 \\
+        --error-rate 0.02 --dead-proxies 2 --out results.json
+
+By default every request asks for a different title, so nothing is served from
+cache; --titles N cycles through N titles to measure the cached path.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from curl_cffi.requests import AsyncSession
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from stub_upstream import StubUpstream, UpstreamState  # noqa: E402
+
+REPO_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Proxy-related variables the API subprocess must not inherit
+_PROXY_ENV = ("HTTP_PROXY", "HTTPS_PROXY", "ALL_PROXY", "NO_PROXY", "http_proxy", "https_proxy", "all_proxy", "no_proxy")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def write_snapshot(path: str, proxies: list[str]):
+    """Warm-start snapshot (see snapshot.py) that seeds the pool with freshly verified proxies."""
+    now = time.time()
+    state = {
+        "version": 1,
+        "saved_at": now,
+        "proxies": [
+            {"proxy": proxy, "success_ewma": 1.0, "latency_ewma": None, "last_verified": now}
+            for proxy in proxies
+        ],
+        "caches": {},
+    }
+    with open(path, "w") as f:
+        json.dump(state, f)
+
+
+def start_api(port: int, stub: StubUpstream, snapshot_path: str, log_file, extra_env: dict) -> subprocess.Popen:
+    env = {k: v for k, v in os.environ.items() if k not in _PROXY_ENV}
+    env.pop("RESOLUTION_DB_PATH", None)
+    env.update({
+        "VIDSRC_BASE_URL": stub.base_url,
+        "CLOUDNESTRA_BASE_URL": stub.base_url,
+        "PROXY_REFRESH_ENABLED": "0",
+        "SNAPSHOT_PATH": snapshot_path,
+        # Keep the seeded snapshot intact for the whole run
+        "SNAPSHOT_INTERVAL": "86400",
+        "PYTHONUNBUFFERED": "1",
+    })
+    env.update(extra_env)
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=REPO_ROOT, env=env, stdout=log_file, stderr=subprocess.STDOUT,
+    )
+
+
+async def wait_until_ready(session: AsyncSession, base: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API exited with code {process.returncode} during startup")
+        try:
+            response = await session.get(f"{base}/", timeout=1)
+            if response.status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("API did not become ready in time")
+
+
+def percentile(ordered: list[float], q: float) -> float | None:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def drive(base: str, titles: list[str], concurrency: int, timeout: float) -> tuple[list, float]:
+    """Requests every title with at most `concurrency` in flight. Returns ([(status, seconds)], wall time)."""
+    results = []
+    queue = iter(titles)
+
+    async with AsyncSession(max_clients=concurrency, trust_env=False) as session:
+        async def worker():
+            for title in queue:
+                started = time.perf_counter()
+                try:
+                    response = await session.get(f"{base}/fetch-embed/{title}", timeout=timeout)
+                    status = response.status_code
+                except Exception:
+                    status = 0
+                results.append((status, time.perf_counter() - started))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return results, time.perf_counter() - started
+
+
+async def resolutions_started(base: str) -> int:
+    """Resolutions the API has started so far (single-flight leaders, see /cache-stats)."""
+    async with AsyncSession(trust_env=False) as session:
+        response = await session.get(f"{base}/cache-stats", timeout=10)
+        return response.json()["coalescing"]["leaders"]
+
+
+def summarize(results: list, wall: float, upstream_calls: dict, resolutions: int) -> dict:
+    latencies = sorted(seconds for _, seconds in results)
+    ok = [seconds for status, seconds in results if status == 200]
+    total_upstream = sum(v for k, v in upstream_calls.items() if k != "injected_errors")
+    statuses: dict = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    ms = lambda seconds: round(seconds * 1000, 2) if seconds is not None else None
+    return {
+        "requests": len(results),
+        "succeeded": len(ok),
+        "success_rate": round(len(ok) / len(results), 4) if results else 0.0,
+        "statuses": statuses,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(results) / wall, 2) if wall else 0.0,
+        "latency_ms": {
+            "mean": ms(sum(latencies) / len(latencies)) if latencies else None,
+            "p50": ms(percentile(latencies, 0.50)),
+            "p95": ms(percentile(latencies, 0.95)),
+            "p99": ms(percentile(latencies, 0.99)),
+            "max": ms(latencies[-1]) if latencies else None,
+        },
+        "upstream_calls": upstream_calls,
+        "resolutions": resolutions,
+        "upstream_calls_per_request": round(total_upstream / len(results), 3) if results else 0.0,
+        "upstream_calls_per_resolution": round(total_upstream / resolutions, 3) if resolutions else 0.0,
+    }
+
+
+async def run(args) -> dict:
+    state = UpstreamState(args.latency, args.jitter, args.error_rate)
+    stub = StubUpstream(state, extra_servers=max(0, args.live_proxies - 1), dead_proxies=args.dead_proxies).start()
+    live = stub.live_proxies[:args.live_proxies]
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot_path = os.path.join(tmp, "warm_start.json")
+        write_snapshot(snapshot_path, live + stub.dead_proxies)
+        extra_env = dict(item.split("=", 1) for item in args.env)
+        log_path = args.server_log or os.devnull
+        with open(log_path, "w") as log_file:
+            process = start_api(port, stub, snapshot_path, log_file, extra_env)
+            try:
+                async with AsyncSession(trust_env=False) as session:
+                    await wait_until_ready(session, base, process)
+
+                if args.warmup:
+                    await drive(base, [f"warmup{i:07d}" for i in range(args.warmup)], args.concurrency, args.timeout)
+                state.reset()
+
+                if args.titles:
+                    titles = [f"tt{i % args.titles:07d}" for i in range(args.requests)]
+                else:
+                    titles = [f"tt{i:07d}" for i in range(args.requests)]
+                if args.missing_rate:
+                    step = max(1, round(1 / args.missing_rate))
+                    # Same number as the title it replaces, so --titles repeats missing ids too
+                    titles = [f"missing{t[2:]}" if i % step == 0 else t for i, t in enumerate(titles)]
+
+                leaders_before = await resolutions_started(base)
+                results, wall = await drive(base, titles, args.concurrency, args.timeout)
+                resolutions = await resolutions_started(base) - leaders_before
+            finally:
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                stub.stop()
+
+    return {
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "titles": args.titles or None,
+            "warmup": args.warmup,
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "error_rate": args.error_rate,
+            "missing_rate": args.missing_rate,
+            "live_proxies": args.live_proxies,
+            "dead_proxies": args.dead_proxies,
+            "env": extra_env,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "results": summarize(results, wall, state.calls(), resolutions),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--titles", type=int, default=0, help="cycle through this many titles (0 = all distinct)")
+    parser.add_argument("--warmup", type=int, default=0, help="requests sent (and discarded) before measuring")
+    parser.add_argument("--latency", type=float, default=0.02, help="upstream latency per hop, seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- random upstream latency, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream responses that are 503s")
+    parser.add_argument("--missing-rate", type=float, default=0.0, help="fraction of titles the upstream 404s")
+    parser.add_argument("--live-proxies", type=int, default=1, help="0 resolves without proxies")
+    parser.add_argument("--dead-proxies", type=int, default=0, help="proxies in the pool that never answer")
+    parser.add_argument("--timeout", type=float, default=60, help="client timeout per /fetch-embed call")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="extra environment for the API process, e.g. --env HEDGE_ENABLED=1")
+    parser.add_argument("--server-log", help="write the API's output here instead of discarding it")
+    parser.add_argument("--out", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    results = report["results"]
+    latency = results["latency_ms"]
+    print(f"requests      {results['requests']} ({results['succeeded']} ok, {results['success_rate']:.1%}) statuses {results['statuses']}")
+    print(f"throughput    {results['throughput_rps']} req/s over {results['wall_seconds']}s")
+    print(f"latency ms    p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    print(f"upstream      {results['upstream_calls_per_request']} calls/request, "
+          f"{results['upstream_calls_per_resolution']} calls/resolution over {results['resolutions']} resolutions "
+          f"{results['upstream_calls']}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
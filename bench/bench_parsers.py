@@ -0,0 +1,234 @@
+"""
+Parser micro-benchmarks for extract.py, with stored baselines as a regression gate.
+
+Runs extract_player_iframe_src, get_iframe_src, extract_player_urls and
+get_mapped_url over the recorded pages in bench/fixtures, as recorded and
+enlarged to 1 MB and 10 MB with inline script filler placed ahead of the
+interesting markup (the worst case for a scan). A full BeautifulSoup parse
+of the embed page is measured alongside (small and 1 MB by default), since
+that is what the iframe extractor falls back to, and every enlarged page
+must parse to the same result as the recorded one. For every case it reports best/median time per call
+and peak traced memory of one call.
+
+    python bench/bench_parsers.py                      # compare with bench/baselines/parsers.json
+    python bench/bench_parsers.py --save-baseline      # record a new baseline
+    python bench/bench_parsers.py --threshold 0.10 --sizes small 1mb
+
+Exits with status 1 when a case is slower (median time) or uses more peak
+memory than its baseline by more than the threshold. Baselines are machine
+specific; record one on the machine that runs the comparison.
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from extract import extract_player_iframe_src, get_iframe_src, extract_player_urls, get_mapped_url  # noqa: E402
+import extract  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "parsers.json")
+
+# Slowdowns smaller than this are treated as timer noise
+MIN_DELTA_MS = 0.05
+
+SIZES = {"small": 0, "1mb": 1024 * 1024, "10mb": 10 * 1024 * 1024}
+
+# Minified-player-shaped filler, wrapped in <script> blocks and a few tags so
+# BeautifulSoup builds a realistic number of nodes
+FILLER = (
+    '<script>var a0=function(b,c){var d=b.length;for(var e=0;e<d;e++){if(b[e]===c)return e}return -1};'
+    'window.pjsdiv=document.getElementById("player_parent");var p={file:"",poster:""};</script>\n'
+    '<div class="ad-slot"><a href="https://example.com/x?y=1"><img src="/img/a.png" alt=""></a></div>\n'
+)
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, name)) as f:
+        return f.read()
+
+
+def enlarge(page: str, target_bytes: int) -> str:
+    """Inserts filler right after the <body> tag until the page reaches target_bytes."""
+    missing = target_bytes - len(page)
+    if missing <= 0:
+        return page
+    filler = FILLER * (missing // len(FILLER) + 1)
+    body_end = page.index(">", page.index("<body")) + 1
+    return page[:body_end] + "\n" + filler[:missing] + page[body_end:]
+
+
+def bs4_player_iframe_src(page: str):
+    """The BeautifulSoup path extract_player_iframe_src falls back to."""
+    iframe = BeautifulSoup(page, "html.parser").find("iframe", id="player_iframe")
+    return iframe.get("src") if iframe else None
+
+
+def build_cases(sizes: list[str], bs4_sizes: list[str]) -> list[tuple[str, Callable, tuple]]:
+    embed = read_fixture("vidsrc_embed.html")
+    rcp = read_fixture("cloudnestra_rcp.html")
+    prorcp = read_fixture("prorcp.html")
+
+    # get_mapped_url works on single templates, so page size doesn't matter to it
+    templates = extract._PLAYER_FILE.search(prorcp).group(1).split(" or ")
+    domains = extract._QUOTED_URL.findall(extract._TEST_DOMS.search(prorcp).group(1))
+    cases = [("get_mapped_url/all_templates", lambda: [get_mapped_url(t, domains) for t in templates], ())]
+
+    # Filler doesn't change what the parsers should find, so every size must match
+    # what BeautifulSoup and the extractors find on the recorded pages
+    expected_iframe = "https:" + bs4_player_iframe_src(embed)
+    expected_prorcp = get_iframe_src(rcp)
+    expected_urls = extract_player_urls(prorcp)
+    assert expected_prorcp and expected_urls, "fixtures no longer parse"
+
+    for size in sizes:
+        big_embed = enlarge(embed, SIZES[size])
+        big_rcp, big_prorcp = enlarge(rcp, SIZES[size]), enlarge(prorcp, SIZES[size])
+        assert extract_player_iframe_src(big_embed) == expected_iframe, f"fast path disagrees with BeautifulSoup at {size}"
+        assert get_iframe_src(big_rcp) == expected_prorcp, f"get_iframe_src result changed at {size}"
+        assert extract_player_urls(big_prorcp) == expected_urls, f"extract_player_urls result changed at {size}"
+
+        cases.append((f"extract_player_iframe_src/{size}", extract_player_iframe_src, (big_embed,)))
+        if size in bs4_sizes:
+            cases.append((f"bs4_player_iframe_src/{size}", bs4_player_iframe_src, (big_embed,)))
+        cases += [
+            (f"get_iframe_src/{size}", get_iframe_src, (big_rcp,)),
+            (f"extract_player_urls/{size}", extract_player_urls, (big_prorcp,)),
+        ]
+    return cases
+
+
+def measure(fn, args: tuple, min_rounds: int, min_time: float) -> dict:
+    """
+    Times fn(*args) for at least min_rounds calls and min_time seconds, then
+    traces one call's peak memory. A call that alone takes longer than
+    min_time is timed just once, on the warm-up call.
+    """
+    t0 = time.perf_counter()
+    fn(*args)  # warm up
+    timings = [time.perf_counter() - t0]
+    if timings[0] < min_time:
+        timings = []
+        started = time.perf_counter()
+        gc.disable()
+        try:
+            while len(timings) < min_rounds or time.perf_counter() - started < min_time:
+                t0 = time.perf_counter()
+                fn(*args)
+                timings.append(time.perf_counter() - t0)
+        finally:
+            gc.enable()
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "rounds": len(timings),
+        "best_ms": round(min(timings) * 1000, 4),
+        "median_ms": round(statistics.median(timings) * 1000, 4),
+        "mean_ms": round(statistics.fmean(timings) * 1000, 4),
+        "stdev_ms": round(statistics.stdev(timings) * 1000, 4) if len(timings) > 1 else 0.0,
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float, memory_threshold: float) -> list[str]:
+    """
+    A case regresses when its median time grows by more than threshold (and
+    by at least MIN_DELTA_MS, so microsecond-scale cases don't flap on noise),
+    or its peak memory grows by more than memory_threshold.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous:
+            continue
+        slower = current["median_ms"] - previous["median_ms"]
+        if slower > previous["median_ms"] * threshold and slower > MIN_DELTA_MS:
+            regressions.append(f"{name}: median {previous['median_ms']}ms -> {current['median_ms']}ms")
+        if current["peak_kib"] > previous["peak_kib"] * (1 + memory_threshold):
+            regressions.append(f"{name}: peak {previous['peak_kib']}KiB -> {current['peak_kib']}KiB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    parser.add_argument("--bs4-sizes", nargs="*", choices=list(SIZES), default=["small", "1mb"],
+                        help="sizes to time the full BeautifulSoup parse at (10mb takes about a minute per parse)")
+    parser.add_argument("--min-rounds", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds spent timing each case")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.30, help="allowed slowdown, as a fraction")
+    parser.add_argument("--memory-threshold", type=float, default=0.10, help="allowed peak memory growth")
+    parser.add_argument("--out", help="also write the results as JSON to this file")
+    args = parser.parse_args()
+
+    # Parsers log misses; keep the table readable
+    logging.getLogger("vidsrc").setLevel(logging.ERROR)
+
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print(f"{'case':<40} {'rounds':>7} {'best ms':>10} {'median ms':>10} {'peak KiB':>10} {'vs base':>8}")
+    results = {}
+    for name, fn, fn_args in build_cases(args.sizes, args.bs4_sizes):
+        result = measure(fn, fn_args, args.min_rounds, args.min_time)
+        results[name] = result
+        previous = baseline.get("results", {}).get(name)
+        ratio = f"{result['median_ms'] / previous['median_ms']:.2f}x" if previous else "-"
+        print(f"{name:<40} {result['rounds']:>7} {result['best_ms']:>10.3f} {result['median_ms']:>10.3f} "
+              f"{result['peak_kib']:>10.1f} {ratio:>8}")
+
+    report = {
+        "environment": {"python": platform.python_version(), "platform": platform.platform()},
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if not baseline:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+        return
+    if baseline.get("environment") != report["environment"]:
+        print(f"⚠️ Baseline was recorded on {baseline.get('environment')}; timings may not be comparable")
+
+    regressions = compare(results, baseline, args.threshold, args.memory_threshold)
+    if regressions:
+        print(f"✗ {len(regressions)} regression(s) beyond the threshold:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("✓ No regressions beyond the threshold")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Micro-benchmark for extract.extract_player_urls on large prorcp player pages.
+
+Real player pages inline several MB of minified player JS ahead of the
+`file:` template. This pads the recorded fixture with JS-shaped filler up to
+each target size and times the current extractor against the previous
+two-scan implementation (kept below for reference).
+
+    python bench/bench_player_urls.py --sizes 0.1 1 5 --repeat 20
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from extract import extract_player_urls  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "prorcp.html")
+
+JS_FILLER = (
+    'var a0=function(b,c){var d=b.length;for(var e=0;e<d;e++){if(b[e]===c)return e}return -1};'
+    'window.pjsdiv=document.getElementById("player_parent");var u="https://cdn.example.com/js/";'
+    'function o(t){return t.replace(/[^a-z0-9]/gi,"").toLowerCase()}var p={file:"",poster:""};\n'
+)
+
+
+def legacy_extract_player_urls(html_content):
+    """The implementation before the precompiled extractor, for comparison."""
+    match = re.search(r'file:\s*"([^"]+)"', html_content)
+    match2 = re.search(r"var\s+test_doms\s*=\s*\[([\s\S]*?)\];", html_content)
+    video_urls = []
+    if match2:
+        video_urls = re.findall(r'["\'](https?://.*?)["\']', match2.group(1))
+    if not match:
+        return []
+    full_urls = []
+    for vdo_url in match.group(1).split(" or "):
+        m = re.search(r'\{v(\d+)\}', vdo_url)
+        url = None
+        if m:
+            v_index = int(m.group(1)) - 1
+            if 0 <= v_index < len(video_urls):
+                url = video_urls[v_index] + vdo_url.split(m.group(0), 1)[1]
+        full_urls.append(url)
+    return full_urls
+
+
+def enlarge(page: str, target_bytes: int) -> str:
+    """Inserts JS filler before the player config until the page reaches target_bytes."""
+    missing = max(0, target_bytes - len(page))
+    filler = JS_FILLER * (missing // len(JS_FILLER) + 1)
+    return page.replace("<body>", "<body>\n<script>" + filler[:missing] + "</script>", 1)
+
+
+def best_of(fn, arg, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=float, nargs="+", default=[0.1, 1, 5], help="page sizes in MB")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with open(FIXTURE) as f:
+        page = f.read()
+
+    print(f"{'size':>8} {'legacy ms':>10} {'current ms':>11} {'speedup':>8}")
+    for size_mb in args.sizes:
+        big = enlarge(page, int(size_mb * 1024 * 1024))
+        expected = [u for u in dict.fromkeys(legacy_extract_player_urls(big)) if u]
+        assert extract_player_urls(big) == expected, "extractors disagree"
+        legacy = best_of(legacy_extract_player_urls, big, args.repeat)
+        current = best_of(extract_player_urls, big, args.repeat)
+        print(f"{size_mb:>6.1f}MB {legacy * 1000:>10.3f} {current * 1000:>11.3f} {legacy / current:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
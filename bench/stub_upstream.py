@@ -0,0 +1,170 @@
+"""
+Local stand-in for vidsrc, cloudnestra and the prorcp player, serving the
+recorded pages in bench/fixtures.
+
+One server plays every upstream host. It also answers proxy-style requests
+(absolute URIs in the request line), so its address can be seeded into the
+proxy pool as a "live proxy". Dead proxies are sockets that accept connections
+at the kernel level but never answer.
+
+    python bench/stub_upstream.py --port 8900 --latency 0.05 --error-rate 0.02
+"""
+import argparse
+import os
+import random
+import re
+import socket
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+
+_ROUTE = re.compile(r"^/(embed/movie|rcp|prorcp)/([^/?#]+)")
+_EMBED_IFRAME_SRC = re.compile(r'(<iframe id="player_iframe" src=")[^"]*(")')
+_RCP_IFRAME_SRC = re.compile(r"(src: ')/prorcp/[^']*(')")
+
+
+def _read_fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, name)) as f:
+        return f.read()
+
+
+class UpstreamState:
+    """Fault-injection settings and per-route request counters, shared by every stub server."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.base_url = ""
+        self.embed_page = _read_fixture("vidsrc_embed.html")
+        self.rcp_page = _read_fixture("cloudnestra_rcp.html")
+        self.prorcp_page = _read_fixture("prorcp.html")
+        self._calls: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def count(self, key: str):
+        with self._lock:
+            self._calls[key] += 1
+
+    def calls(self) -> dict:
+        with self._lock:
+            return dict(self._calls)
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+
+    def delay(self) -> float:
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def page(self, route: str, title: str) -> str:
+        if route == "embed/movie":
+            return _EMBED_IFRAME_SRC.sub(rf"\g<1>{self.base_url}/rcp/{title}\g<2>", self.embed_page, count=1)
+        if route == "rcp":
+            return _RCP_IFRAME_SRC.sub(rf"\g<1>/prorcp/{title}\g<2>", self.rcp_page, count=1)
+        return self.prorcp_page
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: UpstreamState
+
+    def do_GET(self):
+        # Proxied requests carry the absolute URI; the stub serves them itself
+        path = urlsplit(self.path).path if "://" in self.path else self.path
+        match = _ROUTE.match(path)
+        if not match:
+            self.state.count("other")
+            return self._reply(404, "not found")
+
+        route, title = match.groups()
+        self.state.count(route)
+        time.sleep(self.state.delay())
+
+        if self.state.error_rate and random.random() < self.state.error_rate:
+            self.state.count("injected_errors")
+            return self._reply(503, "injected upstream error")
+        # Titles starting with "missing" model ids vidsrc doesn't have
+        if route == "embed/movie" and title.startswith("missing"):
+            return self._reply(404, "not found")
+        self._reply(200, self.state.page(route, title))
+
+    def _reply(self, status: int, body: str):
+        data = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubUpstream:
+    """Runs the stub on `1 + extra_servers` local ports plus `dead_proxies` blackhole sockets."""
+
+    def __init__(self, state: UpstreamState, port: int = 0, extra_servers: int = 0, dead_proxies: int = 0):
+        self.state = state
+        handler = type("BoundStubHandler", (StubHandler,), {"state": state})
+        self.servers = [ThreadingHTTPServer(("127.0.0.1", port), handler)]
+        self.servers += [ThreadingHTTPServer(("127.0.0.1", 0), handler) for _ in range(extra_servers)]
+        for server in self.servers:
+            server.daemon_threads = True
+        self.blackholes = []
+        for _ in range(dead_proxies):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.bind(("127.0.0.1", 0))
+            sock.listen(1024)
+            self.blackholes.append(sock)
+        state.base_url = self.base_url
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.servers[0].server_address[1]}"
+
+    @property
+    def live_proxies(self) -> list[str]:
+        return [f"http://127.0.0.1:{server.server_address[1]}" for server in self.servers]
+
+    @property
+    def dead_proxies(self) -> list[str]:
+        return [f"http://127.0.0.1:{sock.getsockname()[1]}" for sock in self.blackholes]
+
+    def start(self):
+        for server in self.servers:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        for sock in self.blackholes:
+            sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- seconds of random latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of responses turned into 503s")
+    args = parser.parse_args()
+
+    stub = StubUpstream(UpstreamState(args.latency, args.jitter, args.error_rate), port=args.port).start()
+    print(f"Stub upstream listening on {stub.base_url}")
+    print(f"  VIDSRC_BASE_URL={stub.base_url} CLOUDNESTRA_BASE_URL={stub.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+from metrics import breaker_rejections, breaker_transitions
+from logs import get_logger
+
+# Fail fast on upstream hosts with a high recent error rate
+BREAKER_ENABLED = os.getenv("BREAKER_ENABLED", "1") == "1"
+
+# Error rate over the last BREAKER_WINDOW seconds that opens the breaker...
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", "30"))
+# ...once at least this many outcomes were recorded in the window
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+
+# How long an open breaker rejects requests before letting trial requests through
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "15"))
+
+# Trial requests allowed at once while half-open
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", "1"))
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+logger = get_logger("breaker")
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a host whose breaker is open."""
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"Upstream {host} is failing; not calling it for {retry_after:.0f}s")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker for one upstream host.
+
+    Closed: every call goes through; outcomes from the last BREAKER_WINDOW
+    seconds are kept, and the breaker opens when their error rate reaches
+    BREAKER_ERROR_RATE. Open: calls are rejected for BREAKER_OPEN_SECONDS.
+    Half-open: up to BREAKER_HALF_OPEN_PROBES trial calls go through; one
+    success closes the breaker, one failure opens it again.
+
+    Only host failures (5xx, or errors on direct connections) count against
+    the host; callers report proxy failures as inconclusive (None).
+    """
+
+    def __init__(self, host: str):
+        self.host = host
+        self.state = CLOSED
+        self.changed_at = time.monotonic()
+        self._outcomes: deque = deque()  # (monotonic time, ok)
+        self._failures = 0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Returns normally if a call may go ahead, otherwise raises CircuitOpen."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == OPEN:
+                remaining = self.changed_at + BREAKER_OPEN_SECONDS - now
+                if remaining > 0:
+                    breaker_rejections.inc(self.host)
+                    raise CircuitOpen(self.host, remaining)
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                # Trials whose outcome never came back (e.g. cancelled) don't block forever
+                if now - self.changed_at > BREAKER_OPEN_SECONDS:
+                    self._probes = 0
+                    self.changed_at = now
+                if self._probes >= BREAKER_HALF_OPEN_PROBES:
+                    breaker_rejections.inc(self.host)
+                    raise CircuitOpen(self.host, 1)
+                self._probes += 1
+
+    def record(self, ok: bool | None):
+        """Reports the outcome of an allowed call: True, False (host failure) or None (inconclusive)."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if ok is True:
+                    self._transition(CLOSED)
+                elif ok is False:
+                    self._transition(OPEN)
+                return
+            if ok is None:
+                return
+
+            now = time.monotonic()
+            self._outcomes.append((now, ok))
+            if not ok:
+                self._failures += 1
+            while self._outcomes and self._outcomes[0][0] < now - BREAKER_WINDOW:
+                _, old_ok = self._outcomes.popleft()
+                if not old_ok:
+                    self._failures -= 1
+
+            if self.state == CLOSED and len(self._outcomes) >= BREAKER_MIN_CALLS \
+                    and self._failures / len(self._outcomes) >= BREAKER_ERROR_RATE:
+                self._transition(OPEN)
+
+    def _transition(self, state: str):
+        self.changed_at = time.monotonic()
+        # Every state starts from a fresh window and no trials in flight
+        self._outcomes.clear()
+        self._failures = 0
+        self._probes = 0
+        logger.warning("Circuit breaker state changed", extra={"host": self.host, "from": self.state, "to": state})
+        breaker_transitions.inc(self.host, state)
+        self.state = state
+
+    def stats(self) -> dict:
+        with self._lock:
+            calls = len(self._outcomes)
+            return {
+                "state": self.state,
+                "calls": calls,
+                "error_rate": round(self._failures / calls, 4) if calls else 0.0,
+            }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(url: str) -> CircuitBreaker | None:
+    """The breaker for url's host (None when breakers are disabled)."""
+    if not BREAKER_ENABLED:
+        return None
+    host = urlsplit(url).netloc
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(host, CircuitBreaker(host))
+    return breaker
+
+
+def breaker_stats() -> dict:
+    return {host: breaker.stats() for host, breaker in list(_breakers.items())}
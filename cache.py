@@ -0,0 +1,200 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qsl
+
+# Max number of IMDb ids kept in the resolved-stream cache
+STREAM_CACHE_MAX_SIZE = int(os.getenv("STREAM_CACHE_MAX_SIZE", "1024"))
+
+# Fallback TTL (seconds) when the stream URLs carry no expiry token
+STREAM_CACHE_TTL = float(os.getenv("STREAM_CACHE_TTL", "600"))
+
+# Upper bound for TTLs derived from expiry tokens
+STREAM_CACHE_MAX_TTL = float(os.getenv("STREAM_CACHE_MAX_TTL", "3600"))
+
+# Max entries in each per-stage URL cache
+STAGE_CACHE_MAX_SIZE = int(os.getenv("STAGE_CACHE_MAX_SIZE", "4096"))
+
+# TTL (seconds) of the cloudnestra iframe URL found on the vidsrc embed page (hop 1)
+IFRAME_URL_TTL = float(os.getenv("IFRAME_URL_TTL", "1800"))
+
+# TTL (seconds) of the prorcp URL found on the cloudnestra page (hop 2)
+PRORCP_URL_TTL = float(os.getenv("PRORCP_URL_TTL", "600"))
+
+# Max IMDb ids remembered as not available upstream
+NEGATIVE_CACHE_MAX_SIZE = int(os.getenv("NEGATIVE_CACHE_MAX_SIZE", "4096"))
+
+# How long (seconds) a title upstream doesn't have is answered without asking again
+NEGATIVE_CACHE_TTL = float(os.getenv("NEGATIVE_CACHE_TTL", "300"))
+
+# Stop serving a URL this many seconds before its token expires
+EXPIRY_SAFETY_MARGIN = 30
+
+# Query parameters upstream CDNs use for unix-timestamp expiry tokens
+EXPIRY_PARAMS = ("expires", "expire", "expiry", "exp", "e", "valid_until", "deadline")
+
+
+class TTLCache:
+    """
+    Bounded in-process cache with LRU eviction and a per-entry TTL.
+    Safe to use from coroutines and threads.
+
+    With a store (see store.SQLiteStore), writes go through to it and local
+    misses are looked up there, so entries survive restarts and are shared
+    between workers. dumps/loads convert values to and from strings. Store
+    writes are queued to its writer thread; coroutines read with aget(), which
+    runs the store lookup in a thread instead of on the event loop.
+    """
+
+    def __init__(self, name: str, maxsize: int, default_ttl: float,
+                 store=None, dumps=None, loads=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self.store = store
+        self.dumps = dumps or (lambda value: value)
+        self.loads = loads or (lambda raw: raw)
+        self._data: OrderedDict = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.store_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """Returns the cached value, or None on a miss or an expired entry."""
+        found, value = self._get_local(key)
+        if found or self.store is None:
+            return value
+        return self._from_store(key, self.store.get(self.name, key))
+
+    async def aget(self, key):
+        """get() for coroutines: a store lookup doesn't block the event loop."""
+        found, value = self._get_local(key)
+        if found or self.store is None:
+            return value
+        return self._from_store(key, await asyncio.to_thread(self.store.get, self.name, key))
+
+    def _get_local(self, key) -> tuple[bool, object]:
+        """(True, value) on a local hit; (False, None) otherwise, counting the miss if there's no store."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._data[key]
+                self.expirations += 1
+            if self.store is None:
+                self.misses += 1
+            return False, None
+
+    def _from_store(self, key, stored):
+        if stored is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        raw, expires_at = stored
+        value = self.loads(raw)
+        self._put(key, value, expires_at - time.time())
+        with self._lock:
+            self.hits += 1
+            self.store_hits += 1
+        return value
+
+    def set(self, key, value, ttl: float | None = None):
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        self._put(key, value, ttl)
+        if self.store is not None:
+            self.store.set_later(self.name, key, self.dumps(value), ttl)
+
+    def _put(self, key, value, ttl: float):
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def export_entries(self) -> list:
+        """Live entries as [key, expires_at (unix time), dumped value], for the warm-start snapshot."""
+        now_mono, now_wall = time.monotonic(), time.time()
+        with self._lock:
+            items = [(k, exp, v) for k, (exp, v) in self._data.items() if exp > now_mono]
+        return [[k, now_wall + (exp - now_mono), self.dumps(v)] for k, exp, v in items]
+
+    def load_entries(self, entries: list) -> int:
+        """Restores export_entries() output; already-expired entries are skipped."""
+        now = time.time()
+        loaded = 0
+        for key, expires_at, raw in entries:
+            if expires_at > now:
+                self._put(key, self.loads(raw), expires_at - now)
+                loaded += 1
+        return loaded
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+        if self.store is not None:
+            self.store.delete_later(self.name, key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "store_hits": self.store_hits,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def expiry_from_url(url: str) -> float | None:
+    """Returns the unix timestamp carried in a URL's expiry token, if any."""
+    try:
+        query = parse_qsl(urlparse(url).query)
+    except ValueError:
+        return None
+    for name, value in query:
+        if name.lower() in EXPIRY_PARAMS and value.isdigit():
+            timestamp = int(value)
+            # Some CDNs sign with milliseconds
+            if timestamp > 10 ** 12:
+                timestamp //= 1000
+            return float(timestamp)
+    return None
+
+
+def ttl_from_urls(urls: list[str], default_ttl: float = STREAM_CACHE_TTL,
+                  max_ttl: float = STREAM_CACHE_MAX_TTL) -> float:
+    """
+    TTL for a set of resolved URLs: time until the earliest expiry token,
+    minus a safety margin. Falls back to default_ttl when no URL has a token.
+    """
+    expiries = [e for e in (expiry_from_url(u) for u in urls) if e is not None]
+    if not expiries:
+        return default_ttl
+    remaining = min(expiries) - time.time() - EXPIRY_SAFETY_MARGIN
+    return max(0.0, min(remaining, max_ttl))
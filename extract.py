@@ -1,36 +1,102 @@
+import html
 import os
 import re
 import subprocess
 from pathlib import Path
 
 from bs4 import BeautifulSoup
-from curl_cffi import requests
-
 from headers import video_headers
+from session_pool import get_session
+from logs import get_logger
+
+# Origin the relative /prorcp/ path is resolved against (overridable for the offline benchmark stub)
+CLOUDNESTRA_BASE_URL = os.getenv("CLOUDNESTRA_BASE_URL", "https://cloudnestra.com")
+
+logger = get_logger("extract")
+
+
+# Fast path for extract_player_iframe_src: jump to each "player_iframe" occurrence
+# and parse just the enclosing tag instead of building a whole BeautifulSoup tree
+_PLAYER_IFRAME_ID = "player_iframe"
+_IFRAME_TAG = re.compile(r"<iframe\b", re.IGNORECASE)
+_TAG_DELIM = re.compile(r"""[>"']""")
+_TAG_ATTR = re.compile(r"""([^\s=/>"']+)(?:\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'=<>`]+)))?""")
+_SCAN_MISS = object()
+
+
+def _tag_end(html_content: str, pos: int) -> int:
+    """Index of the ">" closing the tag that pos is in, skipping quoted values; -1 if a quote never closes."""
+    while True:
+        m = _TAG_DELIM.search(html_content, pos)
+        if m is None:
+            return -1
+        if m.group() == ">":
+            return m.start()
+        close = html_content.find(m.group(), m.end())
+        if close == -1:
+            return -1
+        pos = close + 1
+
+
+def _scan_player_iframe_src(html_content: str):
+    """
+    Returns the src attribute of the first <iframe id="player_iframe">, or
+    _SCAN_MISS if the scanner couldn't find the tag or isn't sure of it
+    (no src, or a quote that never closes), so the caller does a full parse.
+    """
+    pos = html_content.find(_PLAYER_IFRAME_ID)
+    while pos != -1:
+        tag_start = html_content.rfind("<", 0, pos)
+        if tag_start != -1 and _IFRAME_TAG.match(html_content, tag_start):
+            tag_end = _tag_end(html_content, tag_start + 7)
+            if tag_end == -1:
+                return _SCAN_MISS
+            if tag_end < pos:
+                # This occurrence is after the tag, not inside it
+                pos = html_content.find(_PLAYER_IFRAME_ID, pos + len(_PLAYER_IFRAME_ID))
+                continue
+            attrs = {}
+            # Skip "<iframe"; later duplicates win, as in BeautifulSoup
+            for m in _TAG_ATTR.finditer(html_content, tag_start + 7, tag_end):
+                value = m.group(2) if m.group(2) is not None else m.group(3) if m.group(3) is not None else m.group(4)
+                attrs[m.group(1).lower()] = html.unescape(value) if value is not None else ""
+            if attrs.get("id") == _PLAYER_IFRAME_ID:
+                return attrs["src"] if "src" in attrs else _SCAN_MISS
+        pos = html_content.find(_PLAYER_IFRAME_ID, pos + len(_PLAYER_IFRAME_ID))
+    return _SCAN_MISS
 
 
 def extract_player_iframe_src(html_content: str) -> str | None:
     """
     Parses HTML and extracts the src URL from the iframe with id='player_iframe'.
     Returns the full https URL if found, otherwise None.
+    Tries a targeted scan first and only builds a BeautifulSoup tree when that misses.
     """
     try:
-        soup = BeautifulSoup(html_content, 'html.parser')
+        src_url = _scan_player_iframe_src(html_content)
 
-        iframe = soup.find('iframe', id='player_iframe')
-        if not iframe:
-            print("Could not find the iframe with id 'player_iframe'")
+        if src_url is _SCAN_MISS and _PLAYER_IFRAME_ID not in html_content:
+            # The id appears nowhere, so a full parse can't find it either
+            logger.info("Could not find the iframe with id 'player_iframe'")
             return None
 
-        src_url = iframe.get('src')
+        if src_url is _SCAN_MISS:
+            soup = BeautifulSoup(html_content, 'html.parser')
+
+            iframe = soup.find('iframe', id='player_iframe')
+            if not iframe:
+                logger.info("Could not find the iframe with id 'player_iframe'")
+                return None
+
+            src_url = iframe.get('src')
 
         if src_url and src_url.startswith('//'):
             src_url = 'https:' + src_url
 
         return src_url
 
-    except Exception as e:
-        print(f"Error parsing HTML: {e}")
+    except Exception:
+        logger.exception("Error parsing HTML")
         return None
 
 
@@ -48,46 +114,43 @@ def get_iframe_src(html_content):
     match = re.search(pattern, html_content)
 
     if match:
-        return f"https://cloudnestra.com{match.group(1)}" if match.group(1) else''
+        return f"{CLOUDNESTRA_BASE_URL}{match.group(1)}" if match.group(1) else''
     return None
 
 
-def extract_player_urls(html_content):
-    # Regex explanation:
-    # file:\s* -> Matches the key "file:" followed by optional whitespace
-    # "         -> Matches the opening double quote
-    # ([^"]+)   -> Capturing group: Matches any character that is NOT a double quote (the content)
-    # "         -> Matches the closing double quote
-    pattern = r'file:\s*"([^"]+)"'
-
-    match = re.search(pattern, html_content)
-
-    block_pattern = r"var\s+test_doms\s*=\s*\[([\s\S]*?)\];"
+# Patterns for the prorcp player page, compiled once. Each starts with a literal
+# ("file:", "test_doms") so the regex engine can skip ahead with a fast substring search.
+#   file:\s*"([^"]+)"            -> the " or "-separated stream URL templates
+#   test_doms\s*=\s*\[(...)\];    -> the array of replacement domains
+#   ["'](https?://.*?)["']        -> each domain inside that array
+#   \{v(\d+)\}                    -> the {vN} placeholder in a template
+_PLAYER_FILE = re.compile(r'file:\s*"([^"]+)"')
+_TEST_DOMS = re.compile(r"test_doms\s*=\s*\[([\s\S]*?)\];")
+_QUOTED_URL = re.compile(r'["\'](https?://.*?)["\']')
+_PLACEHOLDER = re.compile(r'\{v(\d+)\}')
 
-    match2 = re.search(block_pattern, html_content)
-    video_urls=[]
 
-    if match2:
-        raw_array_content = match2.group(1)
-
-        # Step 2: Extract the URLs from within that block
-        # This looks for strings inside single or double quotes starting with http
-        url_pattern = r'["\'](https?://.*?)["\']'
+def extract_player_urls(html_content):
+    """
+    Extracts the stream URLs from a prorcp player page.
+    Reads the file template list and the test_doms domain array, resolves every
+    {vN} placeholder against that array, and returns the unique URLs in order.
+    Templates whose placeholder is missing or out of range are skipped.
+    """
+    match = _PLAYER_FILE.search(html_content)
+    if not match:
+        return []
 
-        video_urls = re.findall(url_pattern, raw_array_content)
+    doms_match = _TEST_DOMS.search(html_content)
+    domain_list = _QUOTED_URL.findall(doms_match.group(1)) if doms_match else []
 
-    if match:
-        # The captured group 1 contains the long string of URLs separated by " or "
-        full_string = match.group(1)
-
-        # Split the string into a list using the specific delimiter
-        url_list = full_string.split(" or ")
-        full_urls=[]
-        for vdo_url in url_list:
-            full_urls.append(get_mapped_url(vdo_url, video_urls))
-        return full_urls
-    else:
-        return []
+    # Resolve all templates in one go; dict keeps first-seen order while de-duplicating
+    full_urls = {}
+    for vdo_url in match.group(1).split(" or "):
+        full_url = get_mapped_url(vdo_url, domain_list)
+        if full_url:
+            full_urls[full_url] = None
+    return list(full_urls)
 
 
 def get_mapped_url(template_url, domain_list):
@@ -103,7 +166,7 @@ def get_mapped_url(template_url, domain_list):
         str: The constructed URL, or None if the placeholder is invalid/missing.
     """
     # 1. Find the placeholder (e.g., {v1}, {v2})
-    match = re.search(r'\{v(\d+)\}', template_url)
+    match = _PLACEHOLDER.search(template_url)
 
     if match:
         # 2. Extract the number and convert to 0-based index
@@ -112,13 +175,9 @@ def get_mapped_url(template_url, domain_list):
 
         # 3. Check if the index exists in our domain list
         if 0 <= v_index < len(domain_list):
-            # 4. Split the template at the placeholder to get the path
-            # We discard the left part (old domain) and keep the right part (path)
-            placeholder_str = match.group(0)
-            path_part = template_url.split(placeholder_str, 1)[1]
-
+            # 4. Keep only the path after the placeholder; the old domain is discarded
             # 5. Combine new domain + path
-            return domain_list[v_index] + path_part
+            return domain_list[v_index] + template_url[match.end():]
 
     return None
 
@@ -131,8 +190,8 @@ def get_m3u8_stream(url: str, origin: str = "https://cloudnestra.com", referer:
         # Method 2: Use yt-dlp (if Method 1 doesn't work)
         # download_file(url, "video.mp4", "vidsrc", headers)
 
-    except Exception as e:
-        print(f"An error occurred: {e}")
+    except Exception:
+        logger.exception("Stream download failed", extra={"url": url})
         return None
 
 def download_file_direct(url, filename, folder_name, headers=None):
@@ -151,15 +210,15 @@ def download_file_direct(url, filename, folder_name, headers=None):
 
         output_path = os.path.join(downloads_folder, filename)
 
-        print(f"Downloading: {filename}")
+        logger.info("Downloading", extra={"file_name": filename, "url": url})
 
         # Check if it's an m3u8 playlist
         if '.m3u8' in url.lower():
-            print("Detected m3u8 playlist, using ffmpeg...")
+            logger.info("Detected m3u8 playlist, using ffmpeg")
             return download_m3u8_with_ffmpeg(url, output_path, headers)
 
         # Download with curl_cffi (bypasses many restrictions)
-        response = requests.get(url, headers=headers, impersonate="chrome120", stream=True)
+        response = get_session().get(url, headers=headers, stream=True)
         response.raise_for_status()
 
         # Write to file
@@ -168,11 +227,11 @@ def download_file_direct(url, filename, folder_name, headers=None):
                 if chunk:
                     f.write(chunk)
 
-        print(f"[+] Successfully downloaded: {output_path}")
+        logger.info("Downloaded", extra={"path": output_path})
         return output_path
 
     except Exception as e:
-        print(f"[-] Failed to download {filename}: {e}")
+        logger.error("Download failed", extra={"file_name": filename, "error": str(e)})
         return None
 
 def download_m3u8_with_ffmpeg(url, output_path, headers=None):
@@ -199,16 +258,16 @@ def download_m3u8_with_ffmpeg(url, output_path, headers=None):
             output_path
         ])
 
-        print(f"Command: {' '.join(cmd)}")
+        logger.info("Running ffmpeg", extra={"command": ' '.join(cmd)})
         subprocess.run(cmd, check=True)
-        print(f"[+] Successfully downloaded: {output_path}")
+        logger.info("Downloaded", extra={"path": output_path})
         return output_path
 
     except FileNotFoundError:
-        print("ffmpeg not found. Install with: brew install ffmpeg")
+        logger.error("ffmpeg not found. Install with: brew install ffmpeg")
         return None
     except subprocess.CalledProcessError as e:
-        print(f"[-] ffmpeg failed: {e}")
+        logger.error("ffmpeg failed", extra={"error": str(e)})
         return None
 
 def download_file(url, filename, folder_name, headers=None):
@@ -244,13 +303,12 @@ def download_file(url, filename, folder_name, headers=None):
 
         cmd.append(url)
 
-        print(f"Downloading: {filename}")
-        print(f"Command: {' '.join(cmd)}")
+        logger.info("Downloading with yt-dlp", extra={"file_name": filename, "command": ' '.join(cmd)})
 
         result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        print(f"[+] Successfully downloaded: {output_path}")
+        logger.info("Downloaded", extra={"path": output_path})
 
     except subprocess.CalledProcessError as e:
-        print(f"[-] yt-dlp failed to download {filename}: {e.stderr}")
+        logger.error("yt-dlp failed", extra={"file_name": filename, "error": e.stderr})
     except Exception as e:
-        print(f"[-] Failed to download {filename}: {e}")
\ No newline at end of file
+        logger.error("Download failed", extra={"file_name": filename, "error": str(e)})
\ No newline at end of file
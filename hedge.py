@@ -0,0 +1,104 @@
+import asyncio
+import os
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+# Opt-in: race a second attempt through another proxy when the first is slow
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "0") == "1"
+
+# Fixed hedge delay in seconds. 0 derives it from recent latency (HEDGE_PERCENTILE).
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", "0"))
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.9"))
+
+# Delay used until enough latency samples have been recorded, and the lowest adaptive delay
+HEDGE_DEFAULT_DELAY = 2.0
+HEDGE_MIN_DELAY = 0.25
+HEDGE_MIN_SAMPLES = 20
+
+# Max extra attempts launched per request, so upstream load stays bounded
+HEDGE_MAX_PER_REQUEST = int(os.getenv("HEDGE_MAX_PER_REQUEST", "1"))
+
+
+class LatencyTracker:
+    """Sliding window of recent request latencies (seconds)."""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> float | None:
+        with self._lock:
+            if not self._samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+def hedge_delay(tracker: LatencyTracker) -> float:
+    """How long to wait for the first attempt before launching a hedge."""
+    if HEDGE_DELAY > 0:
+        return HEDGE_DELAY
+    if len(tracker) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    return max(HEDGE_MIN_DELAY, tracker.percentile(HEDGE_PERCENTILE))
+
+
+async def hedged_call(
+    call: Callable[[Any], Awaitable[Any]],
+    first: Any,
+    next_candidate: Callable[[list], Any],
+    accept: Callable[[Any], bool],
+    delay: float,
+    max_hedges: int,
+) -> tuple[Any, Any, list, int]:
+    """
+    Runs call(first). If it has not finished after `delay` seconds, launches
+    call() with next_candidate(in_use) as well, up to max_hedges extra times.
+    The first result accepted by accept() wins and the other attempts are cancelled.
+
+    Returns (candidate, result, failed, hedges_launched), where failed lists
+    (candidate, result) for the other attempts that finished unaccepted. When
+    no attempt is accepted, candidate/result are the last attempt to finish.
+    A result is the exception the attempt raised, if any.
+    """
+    tasks: dict[asyncio.Task, Any] = {asyncio.create_task(call(first)): first}
+    failed: list = []
+    hedges = 0
+
+    try:
+        while tasks:
+            can_hedge = hedges < max_hedges
+            done, _ = await asyncio.wait(
+                tasks, timeout=delay if can_hedge else None, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                candidate = next_candidate(list(tasks.values()))
+                if candidate is None:
+                    # Nothing different to hedge with
+                    max_hedges = hedges
+                    continue
+                hedges += 1
+                tasks[asyncio.create_task(call(candidate))] = candidate
+                continue
+
+            for task in done:
+                candidate = tasks.pop(task)
+                result = task.exception() if task.exception() is not None else task.result()
+                if task.exception() is None and accept(result):
+                    return candidate, result, failed, hedges
+                failed.append((candidate, result))
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    # The last failure is reported as the result itself, not in failed
+    candidate, result = failed.pop()
+    return candidate, result, failed, hedges
@@ -1,59 +1,118 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, HttpUrl
-from requests import get_streaming_url
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field, HttpUrl
+from requests import (
+    resolve_streaming_url,
+    stream_cache,
+    iframe_url_cache,
+    prorcp_url_cache,
+    negative_cache,
+    resolution_flight
+)
 from proxy import (
-    get_working_proxies_async,
-    working_proxy_list
+    get_refresh_job,
+    run_refresh_job,
+    start_refresh_job,
+    working_proxy_pool
 )
+from session_pool import session_pool, evict_idle_sessions_periodically
+from store import resolution_store, vacuum_store_periodically
+from snapshot import SNAPSHOT_PATH, load_snapshot, save_snapshot, save_snapshot_periodically
+from metrics import registry
+from tracing import Trace, current_trace, TRACE_DEBUG_ALLOWED
+from admission import Overloaded, resolution_admission
+from breaker import CircuitOpen, breaker_stats
+import logs
+from logs import get_logger
 import asyncio
+import json
+import math
+import os
 from contextlib import asynccontextmanager
+from typing import List
+
+# Default number of ids a batch resolves at once, and the most a caller may ask for
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+
+# Max ids accepted in one batch request
+BATCH_MAX_IDS = int(os.getenv("BATCH_MAX_IDS", "5000"))
+
+# Fetch and refresh proxies from the public lists. Off for offline runs (e.g. bench/bench_e2e.py),
+# which seed the pool from a warm-start snapshot instead.
+PROXY_REFRESH_ENABLED = os.getenv("PROXY_REFRESH_ENABLED", "1") == "1"
+
+logger = get_logger("main")
 
 # Background task to refresh proxies periodically
 async def refresh_proxies_periodically():
     """Refresh proxies every 5 min in the background."""
     while True:
         await asyncio.sleep(300)  # Wait 5 min
-        print("🔄 Auto-refreshing proxies...")
+        logger.info("Auto-refreshing proxies")
         try:
-            await get_working_proxies_async()
-            print(f"✅ Auto-refresh complete: proxies")
-        except Exception as e:
-            print(f"⚠️ Auto-refresh failed: {e}")
+            job = await run_refresh_job("periodic")
+            logger.info("Auto-refresh complete", extra={"pool_size": job.pool_size})
+        except Exception:
+            logger.exception("Auto-refresh failed")
 
 
 async def fetch_proxies_on_startup():
     """Fetch proxies in background without blocking server startup."""
-    import sys
-    print("🔄 Fetching proxies in background...", flush=True)
-    sys.stdout.flush()
+    logger.info("Fetching proxies in background")
     try:
-        await get_working_proxies_async()
-        print("✅ Proxies loaded and ready!", flush=True)
-        sys.stdout.flush()
-    except Exception as e:
-        print(f"⚠️ Failed to load proxies: {e}", flush=True)
-        import traceback
-        traceback.print_exc()
-        sys.stdout.flush()
+        job = await run_refresh_job("startup")
+        logger.info("Proxies loaded and ready", extra={"pool_size": job.pool_size})
+    except Exception:
+        logger.exception("Failed to load proxies")
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan context manager for startup and shutdown events."""
-    # Start proxy fetching in background (DON'T WAIT FOR IT)
-    proxy_task = asyncio.create_task(fetch_proxies_on_startup())
+    # Restore the last proxy pool and caches first, so revalidation starts from them
+    if SNAPSHOT_PATH:
+        await asyncio.to_thread(load_snapshot)
+
+    proxy_task = refresh_task = None
+    if PROXY_REFRESH_ENABLED:
+        # Start proxy fetching in background (DON'T WAIT FOR IT)
+        proxy_task = asyncio.create_task(fetch_proxies_on_startup())
+
+        # Start periodic refresh task
+        refresh_task = asyncio.create_task(refresh_proxies_periodically())
 
-    # Start periodic refresh task
-    refresh_task = asyncio.create_task(refresh_proxies_periodically())
+    # Close pooled HTTP sessions that have gone idle
+    evict_task = asyncio.create_task(evict_idle_sessions_periodically())
 
-    print("🚀 Server ready! (Proxies loading in background...)")
+    # Purge expired rows from the shared on-disk cache (if enabled)
+    vacuum_task = asyncio.create_task(vacuum_store_periodically()) if resolution_store else None
+
+    # Keep the warm-start snapshot current
+    snapshot_task = asyncio.create_task(save_snapshot_periodically()) if SNAPSHOT_PATH else None
+
+    logger.info("Server ready", extra={"proxy_refresh": PROXY_REFRESH_ENABLED})
 
     yield  # Server is running - accepts requests immediately!
 
     # Shutdown
-    proxy_task.cancel()
-    refresh_task.cancel()
-    print("👋 Shutting down...")
+    if proxy_task:
+        proxy_task.cancel()
+        refresh_task.cancel()
+    evict_task.cancel()
+    if vacuum_task:
+        vacuum_task.cancel()
+    if snapshot_task:
+        snapshot_task.cancel()
+        try:
+            saved = await asyncio.to_thread(save_snapshot)
+            logger.info("Saved warm-start snapshot", extra={"proxies": saved})
+        except Exception:
+            logger.exception("Snapshot save failed")
+    await session_pool.close()
+    if resolution_store:
+        resolution_store.close()
+    logger.info("Shutting down")
 
 
 app = FastAPI(lifespan=lifespan)
@@ -63,6 +122,12 @@ class VideoRequest(BaseModel):
     url: HttpUrl
 
 
+class BatchRequest(BaseModel):
+    imdb_ids: List[str] = Field(min_length=1, max_length=BATCH_MAX_IDS)
+    concurrency: int | None = Field(default=None, ge=1)
+    refresh: bool = False
+
+
 @app.get("/")
 def root():
     return {"message": "Hello World"}
@@ -74,45 +139,232 @@ def get_proxy_stats():
     Get current proxy list statistics.
     This returns the STORED list (no refetch).
     """
+    # One snapshot so the counts agree with each other even mid-refresh
+    pool_stats = working_proxy_pool.stats()
     return {
-        "total_proxies": len(working_proxy_list),
-        "proxies_loaded": len(working_proxy_list) > 0,
+        "total_proxies": pool_stats["active"],
+        "proxies_loaded": pool_stats["active"] > 0,
+        "pool": pool_stats,
         "note": "These are cached proxies loaded at startup"
     }
 
 
-@app.post("/refresh-proxies")
+@app.post("/refresh-proxies", status_code=202)
 async def refresh_proxies():
     """
     Manually refresh the proxy list.
-    This REFETCHES from GitHub and Geonode.
+    This REFETCHES from GitHub and Geonode in the background and returns a job id
+    immediately. If a refresh is already running, its job is returned instead.
     """
     try:
-        # get_working_proxies()
-
-        return {
-            "success": True,
-            "message": "Proxies refreshed",
-        }
+        job, _, started = start_refresh_job("manual")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to refresh proxies: {e}")
 
+    return {
+        "success": True,
+        "message": "Proxy refresh started" if started else "Proxy refresh already running",
+        "job_id": job.id,
+        "job": job.to_dict(),
+    }
+
+
+@app.get("/refresh-proxies/{job_id}")
+def get_refresh_status(job_id: str):
+    """
+    Progress of a proxy refresh job (fetched, tested, healthy, elapsed).
+    """
+    job = get_refresh_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown refresh job")
+    return job.to_dict()
+
+
+@app.get("/cache-stats")
+def get_cache_stats():
+    """
+    Get resolved-stream cache statistics (hits, misses, evictions)
+    and how many requests were coalesced onto an in-flight resolution.
+    """
+    return {
+        "streams": stream_cache.stats(),
+        "iframe_urls": iframe_url_cache.stats(),
+        "prorcp_urls": prorcp_url_cache.stats(),
+        "negative": negative_cache.stats(),
+        "coalescing": resolution_flight.stats(),
+        "store": resolution_store.stats() if resolution_store else None,
+    }
+
+
+_caches = {c.name: c for c in (stream_cache, iframe_url_cache, prorcp_url_cache, negative_cache)}
+
+
+_BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+def _cache_metric(key: str):
+    return lambda: {(name,): cache.stats()[key] for name, cache in _caches.items()}
+
+
+# Numbers other modules already keep, read when /metrics is scraped
+registry.gauge_callback(
+    "vidsrc_proxy_pool_proxies", "Proxies in the pool by state",
+    lambda: {(state,): working_proxy_pool.stats()[state] for state in ("active", "quarantined", "healthy")},
+    ("state",))
+registry.counter_callback(
+    "vidsrc_proxy_selections_total", "Proxies handed out by the pool", lambda: working_proxy_pool.selections)
+registry.counter_callback(
+    "vidsrc_proxy_requests_total", "Requests through pool proxies by outcome",
+    lambda: {("success",): working_proxy_pool.successes, ("failure",): working_proxy_pool.failures},
+    ("outcome",))
+registry.counter_callback(
+    "vidsrc_proxy_quarantines_total", "Times a proxy was quarantined", lambda: working_proxy_pool.quarantines)
+registry.gauge_callback("vidsrc_cache_entries", "Entries per cache", _cache_metric("size"), ("cache",))
+registry.counter_callback("vidsrc_cache_hits_total", "Cache hits", _cache_metric("hits"), ("cache",))
+registry.counter_callback("vidsrc_cache_misses_total", "Cache misses", _cache_metric("misses"), ("cache",))
+registry.gauge_callback("vidsrc_cache_hit_ratio", "Lifetime cache hit ratio", _cache_metric("hit_ratio"), ("cache",))
+registry.gauge_callback(
+    "vidsrc_resolutions_in_flight", "Resolutions currently running", resolution_flight.in_flight)
+registry.gauge_callback(
+    "vidsrc_admission_in_flight", "Resolutions holding an admission slot", lambda: resolution_admission.in_flight)
+registry.gauge_callback(
+    "vidsrc_admission_queue_depth", "Requests waiting for an admission slot", lambda: resolution_admission.queued)
+registry.counter_callback(
+    "vidsrc_admission_admitted_total", "Requests given an admission slot", lambda: resolution_admission.admitted)
+registry.counter_callback(
+    "vidsrc_admission_rejections_total", "Requests rejected with 503 by reason",
+    lambda: {(reason,): count for reason, count in resolution_admission.rejected.items()},
+    ("reason",))
+registry.gauge_callback(
+    "vidsrc_breaker_state", "Circuit breaker state per upstream host (0 closed, 1 half-open, 2 open)",
+    lambda: {(host,): _BREAKER_STATES[s["state"]] for host, s in breaker_stats().items()},
+    ("host",))
+registry.gauge_callback(
+    "vidsrc_breaker_error_rate", "Upstream error rate in the breaker's current window",
+    lambda: {(host,): s["error_rate"] for host, s in breaker_stats().items()},
+    ("host",))
+registry.counter_callback(
+    "vidsrc_log_records_dropped_total", "Log records dropped because the log queue was full",
+    lambda: logs.queue_handler.dropped if logs.queue_handler else 0)
+registry.counter_callback(
+    "vidsrc_resolutions_total", "Resolution requests that started work (leader) or joined one (follower)",
+    lambda: {("leader",): resolution_flight.leaders, ("follower",): resolution_flight.followers},
+    ("role",))
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Prometheus text-format metrics: per-hop and parse latency histograms,
+    attempts per hop and status, proxy pool, caches, circuit breakers and
+    in-flight resolutions.
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 
 @app.get("/fetch-embed/{imdb_id}")
-async def fetch_embed(imdb_id: str):
+async def fetch_embed(imdb_id: str, response: Response, refresh: bool = False, debug: bool = False):
     """
     Fetches video embed content from vidsrc.
+    Results are cached per IMDb id; pass ?refresh=true to force a fresh resolution.
+    Stage timings are returned in the Server-Timing header; with
+    TRACE_DEBUG_ALLOWED=1, ?debug=true also adds the per-attempt trace
+    (proxies, statuses, backoff) to the body.
+    Returns 503 with Retry-After when the server is at capacity (see admission.py)
+    or an upstream host is failing and its circuit breaker is open (see breaker.py).
 
     Example request body:
     {
         "url": "https://vidsrc.xyz/embed/movie/tt5433140"
     }
     """
-    result = await get_streaming_url(f"https://vidsrc.xyz/embed/movie/{imdb_id}")
+    trace = Trace()
+    token = current_trace.set(trace)
+    try:
+        result = await resolve_streaming_url(imdb_id, refresh=refresh)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={
+            "Retry-After": str(e.retry_after),
+            "Server-Timing": trace.server_timing(),
+        })
+    except CircuitOpen as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={
+            "Retry-After": str(math.ceil(e.retry_after)),
+            "Server-Timing": trace.server_timing(),
+        })
+    finally:
+        current_trace.reset(token)
+
+    server_timing = {"Server-Timing": trace.server_timing()}
+    if result is None:
+        detail = "Failed to fetch embed content"
+        if debug and TRACE_DEBUG_ALLOWED:
+            detail = {"message": detail, "trace": trace.to_dict()}
+        raise HTTPException(status_code=400, detail=detail, headers=server_timing)
+
+    response.headers.update(server_timing)
+    body = {"success": True, "content": result}
+    if debug and TRACE_DEBUG_ALLOWED:
+        body["trace"] = trace.to_dict()
+    return body
+
+
 
+
+async def _resolve_for_batch(imdb_id: str, refresh: bool) -> dict:
+    try:
+        result = await resolve_streaming_url(imdb_id, refresh=refresh)
+    except Exception as e:
+        return {"imdb_id": imdb_id, "success": False, "error": f"{type(e).__name__}: {e}"}
     if result is None:
-        raise HTTPException(status_code=400, detail="Failed to fetch embed content")
+        return {"imdb_id": imdb_id, "success": False, "error": "Failed to fetch embed content"}
+    return {"imdb_id": imdb_id, "success": True, "content": [m.model_dump() for m in result]}
+
 
-    return {"success": True, "content": result}
+async def _stream_batch(imdb_ids: List[str], concurrency: int, refresh: bool):
+    """
+    Resolves ids with a fixed number of workers and yields one NDJSON line
+    per id as soon as it finishes.
+    """
+    pending: asyncio.Queue = asyncio.Queue()
+    for imdb_id in imdb_ids:
+        pending.put_nowait(imdb_id)
+    results: asyncio.Queue = asyncio.Queue()
 
+    async def worker():
+        while True:
+            try:
+                imdb_id = pending.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            await results.put(await _resolve_for_batch(imdb_id, refresh))
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(imdb_ids)))]
+    try:
+        for _ in range(len(imdb_ids)):
+            entry = await results.get()
+            yield json.dumps(entry) + "\n"
+    finally:
+        # Client went away or we are done: stop any remaining work
+        for task in workers:
+            task.cancel()
 
+
+@app.post("/fetch-embed/batch")
+async def fetch_embed_batch(batch: BatchRequest):
+    """
+    Resolves many IMDb ids concurrently.
+    Streams one JSON object per line (NDJSON) in completion order; failed ids
+    get an entry with success=false instead of failing the whole batch.
+
+    Example request body:
+    {
+        "imdb_ids": ["tt5433140", "tt0111161"],
+        "concurrency": 8
+    }
+    """
+    concurrency = min(batch.concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    return StreamingResponse(
+        _stream_batch(batch.imdb_ids, concurrency, batch.refresh),
+        media_type="application/x-ndjson",
+    )
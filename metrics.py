@@ -0,0 +1,181 @@
+import bisect
+import math
+import threading
+from typing import Callable
+
+from logs import get_logger
+
+logger = get_logger("metrics")
+
+# Upper bounds (seconds) for upstream hop latencies, which include retries and backoff
+HOP_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60)
+
+# Upper bounds (seconds) for HTML parsing, which is normally sub-millisecond
+PARSE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1, 1)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels (values passed positionally)."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in values]
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels (values passed positionally)."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = HOP_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            series = sorted((k, (list(counts), total)) for k, (counts, total) in self._series.items())
+        lines = []
+        for labels, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Callback:
+    """
+    Gauge or counter whose value is read at scrape time, for numbers other
+    modules already keep (pool size, cache stats). fn returns a number, or a
+    dict mapping label-value tuples to numbers.
+    """
+
+    def __init__(self, kind: str, name: str, help: str, fn: Callable, labelnames: tuple = ()):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.labelnames = labelnames
+
+    def render(self) -> list[str]:
+        value = self.fn()
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [f"{self.name}{_labels(self.labelnames, k)} {_number(v)}" for k, v in sorted(value.items())]
+
+
+class Registry:
+    """Metrics exposed on /metrics, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = HOP_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def gauge_callback(self, name: str, help: str, fn: Callable, labelnames: tuple = ()):
+        return self._register(Callback("gauge", name, help, fn, labelnames))
+
+    def counter_callback(self, name: str, help: str, fn: Callable, labelnames: tuple = ()):
+        return self._register(Callback("counter", name, help, fn, labelnames))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                logger.exception("Metric failed to render", extra={"metric": metric.name})
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Upstream hops of a resolution (hop = embed, cloudnestra, prorcp)
+hop_duration = registry.histogram(
+    "vidsrc_hop_duration_seconds", "Time spent on one upstream hop, including retries", ("hop", "outcome"))
+hop_attempts = registry.counter(
+    "vidsrc_hop_attempts_total", "Upstream attempts per hop by HTTP status (or timeout/error)", ("hop", "status"))
+hop_retries = registry.counter(
+    "vidsrc_hop_retries_total", "Attempts after the first on a hop", ("hop",))
+hop_hedges = registry.counter(
+    "vidsrc_hop_hedges_total", "Hedged extra attempts launched on a hop", ("hop",))
+
+admission_wait = registry.histogram(
+    "vidsrc_admission_wait_seconds", "Time requests spent queued for a resolution slot",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+
+breaker_rejections = registry.counter(
+    "vidsrc_breaker_rejections_total", "Upstream calls refused because the host's breaker was open", ("host",))
+breaker_transitions = registry.counter(
+    "vidsrc_breaker_transitions_total", "Circuit breaker state changes by new state", ("host", "state"))
+
+negative_cache_stores = registry.counter(
+    "vidsrc_negative_cache_stores_total", "Titles cached as not available upstream, by reason", ("reason",))
+
+parse_duration = registry.histogram(
+    "vidsrc_parse_duration_seconds", "Time spent extracting URLs from a fetched page", ("parser",),
+    buckets=PARSE_BUCKETS)
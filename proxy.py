@@ -1,13 +1,277 @@
 import asyncio
-from curl_cffi import requests
+import heapq
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from curl_cffi.requests import AsyncSession
 
-# List of proxies to test
-# Format: protocol://IP:PORT
-socks4_proxy_list = []
+from session_pool import get_async_session
+from logs import get_logger
 
-socks5_proxy_list = []
-http_proxy_list = []
-working_proxy_list = []
+# Smoothing factor for the per-proxy success-rate and latency EWMAs
+EWMA_ALPHA = 0.3
+
+# Latency assumed for a proxy before it has been measured (seconds)
+DEFAULT_LATENCY = 2.0
+
+# Number of random candidates compared on each pick (power of k choices)
+SAMPLE_CHOICES = 2
+
+# Quarantine a proxy after this many consecutive failures...
+QUARANTINE_AFTER_FAILURES = 2
+# ...for QUARANTINE_BASE_SECONDS * 2**(times quarantined before), capped
+QUARANTINE_BASE_SECONDS = 30
+QUARANTINE_MAX_SECONDS = 600
+# Drop a proxy for good once it has been quarantined this many times
+MAX_QUARANTINES = 4
+
+# On refresh, keep unverified proxies from the old pool whose success EWMA is at least this
+KEEP_HEALTHY_MIN_SUCCESS = 0.5
+
+logger = get_logger("proxy")
+
+
+class ProxyStats:
+    __slots__ = ("proxy", "success_ewma", "latency_ewma", "consecutive_failures",
+                 "quarantines", "quarantined_until", "selected", "last_verified")
+
+    def __init__(self, proxy: str, latency: float | None = None):
+        self.proxy = proxy
+        self.success_ewma = 1.0
+        self.latency_ewma = latency
+        self.consecutive_failures = 0
+        self.quarantines = 0
+        self.quarantined_until = 0.0
+        self.selected = 0
+        # Wall-clock time of the last probe pass or successful live request
+        self.last_verified = 0.0
+
+    def score(self) -> float:
+        # Healthy and fast wins: success rate per second of latency
+        return self.success_ewma / (self.latency_ewma or DEFAULT_LATENCY)
+
+
+class ProxyPool:
+    """
+    Working proxies with per-proxy health scores.
+
+    Add, remove and sample are O(1): active proxies live in a list with a
+    dict index, and removal swaps the last element into the gap. Sampling
+    compares SAMPLE_CHOICES random proxies and takes the best score, so fast
+    healthy proxies get most of the traffic without scanning the pool.
+    Failing proxies are quarantined for a while rather than dropped.
+    One lock guards all state, so it is safe from coroutines and threads.
+    """
+
+    def __init__(self):
+        self._active: list[str] = []
+        self._index: dict[str, int] = {}
+        self._stats: dict[str, ProxyStats] = {}
+        self._quarantine: list[tuple[float, str]] = []  # heap of (release_at, proxy)
+        self._lock = threading.Lock()
+        # Lifetime totals; unlike per-proxy stats they survive refreshes
+        self.selections = 0
+        self.successes = 0
+        self.failures = 0
+        self.quarantines = 0
+
+    def add(self, proxy: str, latency: float | None = None):
+        """Adds a proxy that just passed validation (lifting any quarantine)."""
+        with self._lock:
+            stats = self._stats.get(proxy)
+            if stats is None:
+                stats = self._stats[proxy] = ProxyStats(proxy, latency)
+            elif latency is not None:
+                stats.latency_ewma = latency
+            stats.quarantined_until = 0.0
+            stats.consecutive_failures = 0
+            stats.last_verified = time.time()
+            if proxy not in self._index:
+                self._activate(proxy)
+
+    def remove(self, proxy: str):
+        with self._lock:
+            self._deactivate(proxy)
+            self._stats.pop(proxy, None)
+
+    def swap(self, verified, failed=()) -> tuple[int, int]:
+        """
+        Atomically replaces the pool contents with the verified proxies plus
+        the current proxies that are still healthy, except those in failed
+        (proxies that just failed a probe, whatever their traffic stats say).
+        Stats carry over for proxies that stay. Readers see either the old or
+        the new pool, never an empty or half-built one. Returns (size, dropped).
+        """
+        failed = set(failed)
+        with self._lock:
+            self._release_expired()
+            stats: dict[str, ProxyStats] = {}
+            for proxy in verified:
+                entry = self._stats.get(proxy) or ProxyStats(proxy)
+                # Passing a probe lifts any quarantine
+                entry.quarantined_until = 0.0
+                entry.consecutive_failures = 0
+                stats[proxy] = entry
+            for proxy in self._active:
+                entry = self._stats[proxy]
+                if proxy not in stats and proxy not in failed and entry.success_ewma >= KEEP_HEALTHY_MIN_SUCCESS:
+                    stats[proxy] = entry
+
+            dropped = len(self._stats) - len(set(self._stats) & set(stats))
+            active = list(stats)
+            self._active, self._index, self._stats = active, {p: i for i, p in enumerate(active)}, stats
+            self._quarantine = []
+            return len(active), dropped
+
+    def clear(self):
+        with self._lock:
+            self._active.clear()
+            self._index.clear()
+            self._stats.clear()
+            self._quarantine.clear()
+
+    def sample(self, exclude=()) -> str | None:
+        """Picks a proxy, favouring high success rate and low latency. None if the pool is empty."""
+        with self._lock:
+            self._release_expired()
+            if not self._active:
+                return None
+            best = None
+            for _ in range(SAMPLE_CHOICES + len(exclude)):
+                candidate = self._active[random.randrange(len(self._active))]
+                if candidate in exclude:
+                    continue
+                if best is None or self._stats[candidate].score() > self._stats[best].score():
+                    best = candidate
+            if best is not None:
+                self._stats[best].selected += 1
+                self.selections += 1
+            return best
+
+    def record_success(self, proxy: str, latency: float):
+        with self._lock:
+            stats = self._stats.get(proxy)
+            if stats is None:
+                return
+            self.successes += 1
+            stats.success_ewma = EWMA_ALPHA + (1 - EWMA_ALPHA) * stats.success_ewma
+            stats.latency_ewma = latency if stats.latency_ewma is None else \
+                EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * stats.latency_ewma
+            stats.consecutive_failures = 0
+            # A successful live request is as good as a probe
+            stats.last_verified = time.time()
+
+    def record_failure(self, proxy: str):
+        """Counts a failure; quarantines the proxy after repeated failures."""
+        with self._lock:
+            stats = self._stats.get(proxy)
+            if stats is None:
+                return
+            self.failures += 1
+            stats.success_ewma = (1 - EWMA_ALPHA) * stats.success_ewma
+            stats.consecutive_failures += 1
+            if stats.consecutive_failures < QUARANTINE_AFTER_FAILURES:
+                return
+
+            self._deactivate(proxy)
+            self.quarantines += 1
+            if stats.quarantines >= MAX_QUARANTINES:
+                del self._stats[proxy]
+                return
+            duration = min(QUARANTINE_MAX_SECONDS, QUARANTINE_BASE_SECONDS * 2 ** stats.quarantines)
+            stats.quarantines += 1
+            stats.consecutive_failures = 0
+            stats.quarantined_until = time.monotonic() + duration
+            heapq.heappush(self._quarantine, (stats.quarantined_until, proxy))
+
+    def _activate(self, proxy: str):
+        self._index[proxy] = len(self._active)
+        self._active.append(proxy)
+
+    def _deactivate(self, proxy: str):
+        i = self._index.pop(proxy, None)
+        if i is None:
+            return
+        last = self._active.pop()
+        if last != proxy:
+            self._active[i] = last
+            self._index[last] = i
+
+    def _release_expired(self):
+        now = time.monotonic()
+        while self._quarantine and self._quarantine[0][0] <= now:
+            _, proxy = heapq.heappop(self._quarantine)
+            stats = self._stats.get(proxy)
+            # Skip stale heap entries (proxy removed or re-quarantined since)
+            if stats is not None and stats.quarantined_until <= now and proxy not in self._index:
+                self._activate(proxy)
+
+    def is_fresh(self, proxy: str, max_age: float) -> bool:
+        """True if the proxy is active and was verified within max_age seconds."""
+        with self._lock:
+            stats = self._stats.get(proxy)
+            return proxy in self._index and stats.last_verified >= time.time() - max_age
+
+    def __len__(self):
+        return len(self._active)
+
+    def __contains__(self, proxy: str):
+        return proxy in self._index
+
+    def proxies(self) -> list[str]:
+        with self._lock:
+            return list(self._active)
+
+    def export_state(self) -> list[dict]:
+        """Active proxies with their scores, for the warm-start snapshot."""
+        with self._lock:
+            return [
+                {
+                    "proxy": proxy,
+                    "success_ewma": self._stats[proxy].success_ewma,
+                    "latency_ewma": self._stats[proxy].latency_ewma,
+                    "last_verified": self._stats[proxy].last_verified,
+                }
+                for proxy in self._active
+            ]
+
+    def load_state(self, entries: list[dict], max_age: float) -> int:
+        """Restores proxies from export_state(), skipping ones not verified within max_age seconds."""
+        cutoff = time.time() - max_age
+        loaded = 0
+        with self._lock:
+            for entry in entries:
+                proxy = entry["proxy"]
+                if entry.get("last_verified", 0) < cutoff or proxy in self._stats:
+                    continue
+                stats = ProxyStats(proxy, entry.get("latency_ewma"))
+                stats.success_ewma = entry.get("success_ewma", 1.0)
+                stats.last_verified = entry["last_verified"]
+                self._stats[proxy] = stats
+                self._activate(proxy)
+                loaded += 1
+        return loaded
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._release_expired()
+            return {
+                "total": len(self._stats),
+                "active": len(self._active),
+                "quarantined": len(self._stats) - len(self._active),
+                "healthy": sum(self._stats[p].success_ewma >= KEEP_HEALTHY_MIN_SUCCESS for p in self._active),
+                "selections": sum(s.selected for s in self._stats.values()),
+                "selections_total": self.selections,
+                "successes_total": self.successes,
+                "failures_total": self.failures,
+                "quarantines_total": self.quarantines,
+            }
+
+
+working_proxy_pool = ProxyPool()
 
 # URL to test IP (shows your IP)
 TEST_URL = "https://api.ipify.org"
@@ -15,118 +279,341 @@ TEST_URL = "https://api.ipify.org"
 # Timeout for each request in seconds
 TIMEOUT = 10
 
-def get_github_proxies(protocol: str):
-    url = f"https://raw.githubusercontent.com/TheSpeedX/PROXY-List/refs/heads/master/{protocol}.txt"
-    response = requests.get(url)
-    response.raise_for_status()
-    lines = response.text.splitlines()
-    proxies = [f"{protocol}://{line.strip()}" for line in lines if line.strip()]
-    if protocol == "socks4":
-        socks4_proxy_list.extend(proxies)
-    elif protocol == "socks5":
-        socks5_proxy_list.extend(proxies)
-    elif protocol == "http":
-        http_proxy_list.extend(proxies)
-
-def get_geonode_proxies():
-    url = "https://proxylist.geonode.com/api/proxy-list?limit=500&page=1&sort_by=lastChecked&sort_type=desc"
-    response = requests.get(url)
-    response.raise_for_status()
-    for data in response.json()["data"]:
+# Timeout for a single validation probe (seconds)
+PROBE_TIMEOUT = 5
+
+# Max validation probes in flight at once (all on one event loop)
+PROBE_CONCURRENCY = int(os.getenv("PROXY_PROBE_CONCURRENCY", "500"))
+
+# Stop validating once this many proxies have passed (0 = test every candidate)
+TARGET_HEALTHY_PROXIES = int(os.getenv("PROXY_TARGET_HEALTHY", "50"))
+
+# Proxy list sources: name -> (url, parser)
+GITHUB_PROXY_URL = "https://raw.githubusercontent.com/TheSpeedX/PROXY-List/refs/heads/master/{protocol}.txt"
+GEONODE_PROXY_URL = "https://proxylist.geonode.com/api/proxy-list?limit=500&page=1&sort_by=lastChecked&sort_type=desc"
+
+# Proxies verified (by probe or live traffic) within this many seconds are not re-probed
+PROXY_REVERIFY_AFTER = float(os.getenv("PROXY_REVERIFY_AFTER", "900"))
+
+
+class _SourceState:
+    __slots__ = ("etag", "last_modified", "proxies")
+
+    def __init__(self, etag, last_modified, proxies):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.proxies = proxies
+
+
+# Validators and last parsed list per source, for conditional requests
+_source_states: dict[str, _SourceState] = {}
+
+# Wall-clock time each candidate last failed a probe; skipped until PROXY_REVERIFY_AFTER passes
+_failed_probes: dict[str, float] = {}
+
+
+def parse_github_proxies(protocol: str, text: str) -> list[str]:
+    return [f"{protocol}://{line.strip()}" for line in text.splitlines() if line.strip()]
+
+
+def parse_geonode_proxies(payload: dict) -> list[str]:
+    proxies = []
+    for data in payload["data"]:
         if "socks4" in data["protocols"]:
-            socks4_proxy_list.append(f"socks4://{data['ip']}:{data['port']}")
+            proxies.append(f"socks4://{data['ip']}:{data['port']}")
         elif "socks5" in data["protocols"]:
-            socks5_proxy_list.append(f"socks5://{data['ip']}:{data['port']}")
+            proxies.append(f"socks5://{data['ip']}:{data['port']}")
         elif "http" in data["protocols"]:
-            http_proxy_list.append(f"http://{data['ip']}:{data['port']}")
+            proxies.append(f"http://{data['ip']}:{data['port']}")
+    return proxies
+
+
+async def fetch_proxy_source(name: str, url: str, parse) -> list[str]:
+    """
+    Downloads one proxy list with If-None-Match / If-Modified-Since.
+    A 304 reuses the list parsed last time.
+    """
+    state = _source_states.get(name)
+    headers = {}
+    if state and state.etag:
+        headers["If-None-Match"] = state.etag
+    if state and state.last_modified:
+        headers["If-Modified-Since"] = state.last_modified
+
+    response = await get_async_session().get(url, headers=headers, timeout=TIMEOUT)
+    if response.status_code == 304 and state:
+        logger.info("Proxy source unchanged", extra={"source": name, "proxies": len(state.proxies)})
+        return state.proxies
+    response.raise_for_status()
+
+    proxies = parse(response)
+    _source_states[name] = _SourceState(
+        response.headers.get("ETag"), response.headers.get("Last-Modified"), proxies
+    )
+    return proxies
+
+
+async def fetch_all_proxy_sources() -> list[str]:
+    """Fetches every source in parallel and returns the de-duplicated union."""
+    sources = [
+        (f"github_{protocol}", GITHUB_PROXY_URL.format(protocol=protocol),
+         lambda r, p=protocol: parse_github_proxies(p, r.text))
+        for protocol in ("socks4", "socks5", "http")
+    ]
+    sources.append(("geonode", GEONODE_PROXY_URL, lambda r: parse_geonode_proxies(r.json())))
+
+    results = await asyncio.gather(
+        *(fetch_proxy_source(name, url, parse) for name, url, parse in sources),
+        return_exceptions=True,
+    )
+    merged: dict[str, None] = {}
+    for (name, _, _), result in zip(sources, results):
+        if isinstance(result, Exception):
+            logger.warning("Error fetching proxy source", extra={"source": name, "error": str(result)})
+            continue
+        merged.update(dict.fromkeys(result))
+    return list(merged)
 
 
 
 # Function to test a single proxy
-def test_proxy(proxy: str):
+async def test_proxy(proxy: str, session: AsyncSession) -> str | None:
+    """
+    Probes one proxy through a shared AsyncSession and publishes it to the
+    pool the moment it passes, so requests can use it right away.
+    """
     try:
-        response = requests.get(
+        started = time.monotonic()
+        response = await session.get(
             TEST_URL,
-            proxies={"http": proxy, "https": proxy},
-            impersonate="chrome120",
-            timeout=5,  # Shorter timeout for testing (5s instead of 10s)
+            proxy=proxy,
+            timeout=PROBE_TIMEOUT,
         )
         if response.status_code == 200:
-            print(f"[✅ WORKING] {proxy}")
-            working_proxy_list.append(proxy)
+            latency = time.monotonic() - started
+            logger.info("Proxy probe passed", extra={"proxy": proxy, "latency_ms": round(latency * 1000, 1),
+                                                     "sample": "probe_passed"})
+            working_proxy_pool.add(proxy, latency=latency)
+            _failed_probes.pop(proxy, None)
             return proxy
-    except Exception:
-        # Silently fail - most proxies are dead
-        pass
+    except Exception as e:
+        # Most proxies are dead, so failures are only logged at debug level
+        logger.debug("Proxy probe failed", extra={"proxy": proxy, "error": type(e).__name__,
+                                                  "sample": "probe_failed"})
+    _failed_probes[proxy] = time.time()
     return None
 
-# Async wrapper to test all proxies concurrently with limits
-async def test_all_proxies(proxy_list, max_concurrent=50):
-    """Test proxies with concurrency limit to avoid overwhelming free-tier hosts."""
-    semaphore = asyncio.Semaphore(max_concurrent)
+async def test_all_proxies(proxy_list, max_concurrent=PROBE_CONCURRENCY, target_healthy=TARGET_HEALTHY_PROXIES,
+                           job: "RefreshJob | None" = None):
+    """
+    Test proxies on one event loop with up to max_concurrent probes in flight.
+    Stops early once target_healthy proxies have passed (0 tests them all).
+    Returns (working_proxies, tested_count).
+    """
+    working_proxies = []
+    tested = 0
+    candidates = iter(proxy_list)
+    enough = asyncio.Event()
+
+    async def worker(session):
+        nonlocal tested
+        for proxy in candidates:
+            if enough.is_set():
+                return
+            result = await test_proxy(proxy, session)
+            tested += 1
+            if job:
+                job.tested += 1
+            if result:
+                working_proxies.append(result)
+                if job:
+                    job.healthy += 1
+                if target_healthy and len(working_proxies) >= target_healthy:
+                    enough.set()
 
-    async def test_with_limit(proxy):
-        async with semaphore:
-            return await asyncio.to_thread(test_proxy, proxy)
+    worker_count = min(max_concurrent, len(proxy_list))
+    async with AsyncSession(max_clients=worker_count, impersonate="chrome120") as session:
+        workers = [asyncio.create_task(worker(session)) for _ in range(worker_count)]
+        all_done = asyncio.create_task(asyncio.wait(workers))
+        target_reached = asyncio.create_task(enough.wait())
+        await asyncio.wait([all_done, target_reached], return_when=asyncio.FIRST_COMPLETED)
+        # Remaining probes are only waiting on dead proxies' timeouts
+        for task in workers + [all_done, target_reached]:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
 
-    tasks = [test_with_limit(proxy) for proxy in proxy_list]
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-    working_proxies = [p for p in results if p and not isinstance(p, Exception)]
-    return working_proxies
+    return working_proxies, tested
 
-async def get_working_proxies_async(max_proxies_to_test=200):
+async def get_working_proxies_async(max_proxies_to_test=None, target_healthy=TARGET_HEALTHY_PROXIES,
+                                    job: "RefreshJob | None" = None):
     """
     Fetches and tests proxies asynchronously.
     Can be called directly from async context (FastAPI lifespan).
 
+    Refreshes are incremental: sources are fetched in parallel with conditional
+    requests, proxies verified within PROXY_REVERIFY_AFTER seconds (by a probe
+    or by live traffic) are kept without probing, and only stale pool members
+    and new candidates are tested. Verified proxies join the pool as they pass;
+    testing stops at target_healthy.
+
     Args:
         max_proxies_to_test: Limit testing to this many proxies (useful for free-tier hosting)
+        target_healthy: Stop once this many proxies work (0 = test everything)
+        job: RefreshJob to report progress to
     """
-    print("📋 Clearing old proxy lists...", flush=True)
-    working_proxy_list.clear()
-    socks4_proxy_list.clear()
-    socks5_proxy_list.clear()
-    http_proxy_list.clear()
+    # The live pool is never cleared: new proxies are added as they pass and
+    # stale ones are dropped in one atomic swap at the end
+    logger.info("Fetching proxy lists from sources")
+    fetched = await fetch_all_proxy_sources()
+    total_fetched = len(fetched)
+    if job:
+        job.fetched = total_fetched
+
+    pool_members = working_proxy_pool.proxies()
+    fresh = [p for p in pool_members if working_proxy_pool.is_fresh(p, PROXY_REVERIFY_AFTER)]
+    fresh_set = set(fresh)
+    stale_members = [p for p in pool_members if p not in fresh_set]
+    known = set(pool_members)
+    # Forget failures of proxies no longer listed by any source, and skip recent ones
+    recent_failure = time.time() - PROXY_REVERIFY_AFTER
+    for proxy in set(_failed_probes) - set(fetched):
+        del _failed_probes[proxy]
+    new_candidates = [p for p in fetched if p not in known and _failed_probes.get(p, 0) < recent_failure]
+    # Mix protocols so an early stop doesn't leave us with only the first source
+    random.shuffle(new_candidates)
+
+    # Re-check stale pool members first, then new candidates only if still short of the target
+    remaining_target = max(0, target_healthy - len(fresh)) if target_healthy else 0
+    to_probe = stale_members
+    if not target_healthy or remaining_target > 0:
+        to_probe = stale_members + new_candidates
+
+    # Limit proxies on free tier to avoid timeouts/memory issues
+    if max_proxies_to_test and len(to_probe) > max_proxies_to_test:
+        logger.info("Limiting proxies to test", extra={"limit": max_proxies_to_test, "candidates": len(to_probe)})
+        to_probe = to_probe[:max_proxies_to_test]
+
+    skipped_failed = total_fetched - len(known & set(fetched)) - len(new_candidates)
+    logger.info("Testing proxies", extra={"fetched": total_fetched, "fresh": len(fresh),
+                                          "failed_recently": skipped_failed, "to_test": len(to_probe)})
+
+    if total_fetched == 0 and not pool_members:
+        logger.warning("No proxies fetched")
+        return working_proxy_pool
+
+    working, tested = [], 0
+    if job:
+        job.skipped_fresh = len(fresh)
+        job.to_test = len(to_probe)
+    probes_started = time.time()
+    if to_probe:
+        working, tested = await test_all_proxies(to_probe, target_healthy=remaining_target, job=job)
+    # Stale members that failed their re-probe go, however healthy their traffic stats look
+    failed_members = [p for p in stale_members if _failed_probes.get(p, 0) >= probes_started]
+    pool_size, dropped = working_proxy_pool.swap(fresh + working, failed=failed_members)
+    if job:
+        job.pool_size = pool_size
+
+    working_count = len(working)
+    success_rate = (working_count / tested * 100) if tested > 0 else 0
 
-    print("📥 Fetching proxy lists from sources...", flush=True)
+    logger.info("Proxy testing complete", extra={
+        "fetched": total_fetched,
+        "skipped_fresh": len(fresh),
+        "tested": tested,
+        "working": working_count,
+        "failed": tested - working_count,
+        "success_rate": round(success_rate, 1),
+        "pool_size": pool_size,
+        "dropped": dropped,
+    })
+
+    return working_proxy_pool
+
+class RefreshJob:
+    """Status of one proxy refresh run, reported by the /refresh-proxies endpoints."""
+
+    def __init__(self, trigger: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.trigger = trigger
+        self.state = "running"
+        self.started_at = time.time()
+        self.finished_at: float | None = None
+        self.error: str | None = None
+        self.fetched = 0
+        self.skipped_fresh = 0
+        self.to_test = 0
+        self.tested = 0
+        self.healthy = 0
+        self.pool_size: int | None = None
+
+    def to_dict(self) -> dict:
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.id,
+            "trigger": self.trigger,
+            "state": self.state,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed": round(end - self.started_at, 2),
+            "fetched": self.fetched,
+            "skipped_fresh": self.skipped_fresh,
+            "to_test": self.to_test,
+            "tested": self.tested,
+            "healthy": self.healthy,
+            "pool_size": self.pool_size,
+            "error": self.error,
+        }
+
+
+# Most recent refresh jobs by id (oldest evicted first)
+MAX_REFRESH_JOBS_KEPT = 20
+_refresh_jobs: "OrderedDict[str, RefreshJob]" = OrderedDict()
+_running_refresh: tuple[RefreshJob, asyncio.Task] | None = None
+
+
+async def _run_refresh_job(job: RefreshJob):
     try:
-        await asyncio.to_thread(get_github_proxies, "socks4")
-        await asyncio.to_thread(get_github_proxies, "socks5")
-        await asyncio.to_thread(get_github_proxies, "http")
-        await asyncio.to_thread(get_geonode_proxies)
+        await get_working_proxies_async(job=job)
+        job.state = "completed"
     except Exception as e:
-        print(f"⚠️ Error fetching proxies: {e}", flush=True)
+        job.state = "failed"
+        job.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        job.finished_at = time.time()
 
-    all_proxies = socks4_proxy_list + socks5_proxy_list + http_proxy_list
-    total_fetched = len(all_proxies)
 
-    # Limit proxies on free tier to avoid timeouts/memory issues
-    if max_proxies_to_test and total_fetched > max_proxies_to_test:
-        print(f"📊 Limiting to first {max_proxies_to_test} proxies (fetched {total_fetched})", flush=True)
-        all_proxies = all_proxies[:max_proxies_to_test]
-        total_fetched = len(all_proxies)
+def start_refresh_job(trigger: str = "manual") -> tuple[RefreshJob, asyncio.Task, bool]:
+    """
+    Starts a background proxy refresh, or returns the one already running so
+    concurrent triggers share it. Returns (job, task, started_new).
+    """
+    global _running_refresh
+    if _running_refresh and not _running_refresh[1].done():
+        return _running_refresh[0], _running_refresh[1], False
 
-    print(f"📊 Testing {total_fetched} proxies...", flush=True)
+    job = RefreshJob(trigger)
+    task = asyncio.create_task(_run_refresh_job(job))
+    # The caller may not await it; keep a failed run's exception from being reported as unretrieved
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    _running_refresh = (job, task)
+    _refresh_jobs[job.id] = job
+    while len(_refresh_jobs) > MAX_REFRESH_JOBS_KEPT:
+        _refresh_jobs.popitem(last=False)
+    return job, task, True
 
-    if total_fetched == 0:
-        print("⚠️ No proxies fetched!", flush=True)
-        return working_proxy_list
 
-    # Test all proxies (directly await, no asyncio.run)
-    await test_all_proxies(all_proxies)
+async def run_refresh_job(trigger: str) -> RefreshJob:
+    """Starts (or joins) a refresh and waits for it to finish."""
+    job, task, _ = start_refresh_job(trigger)
+    await asyncio.shield(task)
+    return job
 
-    working_count = len(working_proxy_list)
-    success_rate = (working_count / total_fetched * 100) if total_fetched > 0 else 0
 
-    print(f"\n{'='*50}")
-    print(f"✅ Testing complete!")
-    print(f"📊 Total fetched: {total_fetched}")
-    print(f"✅ Working proxies: {working_count}")
-    print(f"❌ Failed proxies: {total_fetched - working_count}")
-    print(f"📈 Success rate: {success_rate:.1f}%")
-    print(f"{'='*50}\n")
+def get_refresh_job(job_id: str) -> RefreshJob | None:
+    return _refresh_jobs.get(job_id)
 
-    return working_proxy_list
 
 def get_working_proxies():
     """
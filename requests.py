@@ -1,225 +1,404 @@
 import time
-import random
+import asyncio
+import json
+import os
+from contextvars import ContextVar
 from typing import List, Dict
 
 from extract import extract_player_iframe_src, extract_player_urls, get_iframe_src, get_m3u8_stream
-from proxy import working_proxy_list
+from proxy import working_proxy_pool
 from headers import video_headers, cloud_nestra_headers, cloud_nestra_prorcp_headers
-from curl_cffi import requests
+from session_pool import get_async_session
+from cache import (
+    TTLCache,
+    ttl_from_urls,
+    STREAM_CACHE_MAX_SIZE,
+    STREAM_CACHE_TTL,
+    STAGE_CACHE_MAX_SIZE,
+    IFRAME_URL_TTL,
+    PRORCP_URL_TTL,
+    NEGATIVE_CACHE_MAX_SIZE,
+    NEGATIVE_CACHE_TTL,
+)
+from singleflight import SingleFlight
+from admission import resolution_admission
+from store import resolution_store
+from hedge import LatencyTracker, hedged_call, hedge_delay, HEDGE_ENABLED, HEDGE_MAX_PER_REQUEST
+from retry import Deadline, retry_async, RESOLUTION_DEADLINE
+from breaker import CircuitOpen, breaker_for
+from metrics import hop_attempts, hop_duration, hop_hedges, hop_retries, negative_cache_stores, parse_duration
+from tracing import event, span
+from logs import get_logger
 from pydantic import BaseModel
 
-last_working_proxy = None
+logger = get_logger("requests")
 
-def get_random_proxy(is_latest:bool=False) -> dict | None:
+# Proxy that served the previous hop of the current request (per request, not global)
+request_proxy: ContextVar[str | None] = ContextVar("request_proxy", default=None)
+
+# Recent successful hop-1 latencies, used to pick the hedge delay
+embed_latency = LatencyTracker()
+
+
+class TitleUnavailable(Exception):
     """
-    Get a random proxy from the working proxy list.
+    Upstream answered, and it doesn't have the title: the embed page was a
+    404/410, or had no player iframe or stream URLs. Unlike a None result (timeouts,
+    5xx, dead proxies), retrying soon won't help.
+    """
+
+    def __init__(self, reason: str, url: str):
+        super().__init__(f"Title not available upstream ({reason}): {url}")
+        self.reason = reason
+        self.url = url
+
+
+def get_random_proxy(exclude=()) -> dict | None:
+    """
+    Get a proxy for the next attempt.
+    Reuses the proxy that served this request's previous hop (its connection is
+    still warm), otherwise samples the pool favouring fast, healthy proxies.
     Returns a dict formatted for curl_cffi requests.
     Returns None if no working proxies available (will use direct connection).
     """
-    if last_working_proxy:
-        return {"http": last_working_proxy, "https": last_working_proxy}
-    if not working_proxy_list:
+    proxy = request_proxy.get()
+    if not proxy or proxy in exclude or proxy not in working_proxy_pool:
+        proxy = working_proxy_pool.sample(exclude)
+    if not proxy:
         # No proxies available - will fallback to direct connection
         return None
-
-    if is_latest:
-        proxy = working_proxy_list[-1]
-    else:
-        proxy = random.choice(working_proxy_list)
     # Format: {"http": "socks5://ip:port", "https": "socks5://ip:port"}
     return {"http": proxy, "https": proxy}
 
 
-def fetch_vidsrc_embed(url: str, max_retries: int = 3, use_proxy: bool = True) -> str | None:
-    """
-    Fetches vidsrc embed page with retry logic.
-    Retries up to max_retries times with exponential backoff.
-    """
-    headers = {
-        "Referer": "https://vidsrc.xyz/",
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
-    }
+VIDSRC_HEADERS = {
+    "Referer": "https://vidsrc.xyz/",
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36"
+}
 
-    for attempt in range(max_retries):
-        # First attempt: use random proxy
-        # Retry attempts: use last proxy from list
-        proxy_dict = get_random_proxy(is_latest=attempt!=0) if use_proxy else None
-        try:
-            if proxy_dict:
-                print(f"Attempt {attempt + 1}/{max_retries}: Fetching {url} via proxy {proxy_dict['http']}")
-            else:
-                print(f"Attempt {attempt + 1}/{max_retries}: Fetching {url} (no proxy)")
-
-            # 'impersonate' makes the server think this is real Chrome
-            response = requests.get(
-                url,
-                headers=headers,
-                proxies=proxy_dict,  # Add proxy here
-                impersonate="chrome120",
-                timeout=10
-            )
-
-            # Check for success
-            if response.status_code == 200:
-                print(f"✓ Success! Status Code: {response.status_code}")
-                global last_working_proxy
-                last_working_proxy = proxy_dict['http'] if proxy_dict else None
-                return response.text
-
-            print(f"✗ Failed with status: {response.status_code}")
-
-            # Don't retry on client errors (4xx), only server errors (5xx) and timeouts
-            if 400 <= response.status_code < 500:
-                return None
 
-        except TimeoutError:
-            print(f"✗ Request timed out on attempt {attempt + 1}")
-        except Exception as e:
-            print(f"✗ Error on attempt {attempt + 1}: {type(e).__name__}: {e}")
+async def _async_get(url: str, headers: dict, proxy: str | None, timeout: float = 10):
+    session = get_async_session(proxy)
+    return await session.get(url, headers=headers, timeout=timeout)
 
-        if proxy_dict and proxy_dict['http'] in working_proxy_list:
-            working_proxy_list.remove(proxy_dict['http'])
-            last_working_proxy = None
-        # Exponential backoff: wait 1s, 2s, 4s between retries
-        if attempt < max_retries - 1:
-            wait_time = 2 ** attempt
-            print(f"⏳ Waiting {wait_time}s before retry...")
-            time.sleep(wait_time)
 
-    print(f"✗ All {max_retries} attempts failed")
-    return None
+# 4xx statuses that mean upstream doesn't have the page
+MISSING_STATUSES = (404, 410)
 
-# cloudnestra_url = "https://cloudnestra.com/rcp/..."
-# referer = "https://vidsrc.xyz/embed/movie/tt5433140"
+# 4xx statuses that are about the caller, not the page: blocked proxy IPs, timeouts, rate limits.
+# They are retried through another proxy like a 5xx or a connection error.
+TRANSIENT_CLIENT_STATUSES = (403, 408, 429)
 
-def get_cloudnestra(url: str, referer: str, max_retries: int = 3, use_proxy: bool = True) -> str | None:
-    """Fetches cloudnestra page with retry logic."""
 
-    for attempt in range(max_retries):
-        # First attempt: random proxy, retries: last proxy
-        proxy_dict = get_random_proxy(is_latest=attempt!=0) if use_proxy else None
+def _is_server_error(result) -> bool:
+    """True for a 5xx response (the upstream failed, not the proxy that carried it)."""
+    return getattr(result, "status_code", 0) >= 500
 
-        try:
-            response = requests.get(
-                url,
-                headers=cloud_nestra_headers(referer=referer),
-                proxies=proxy_dict,
-                impersonate="chrome120",
-                timeout=10
-            )
-
-            if response.status_code == 200:
-                print(f"✓ Cloudnestra fetch success")
-                global last_working_proxy
-                last_working_proxy = proxy_dict['http'] if proxy_dict else None
-                return response.text
-
-            print(f"✗ Cloudnestra failed with status: {response.status_code}")
-            if 400 <= response.status_code < 500:
-                return None
 
-        except TimeoutError:
-            print(f"✗ Cloudnestra request timed out on attempt {attempt + 1}")
-        except Exception as e:
-            print(f"✗ Cloudnestra error on attempt {attempt + 1}: {type(e).__name__}: {e}")
+def _proxy_failed(proxy: str | None):
+    if not proxy:
+        return
+    working_proxy_pool.record_failure(proxy)
+    if request_proxy.get() == proxy:
+        request_proxy.set(None)
 
-        if proxy_dict and proxy_dict['http'] in working_proxy_list:
-            working_proxy_list.remove(proxy_dict['http'])
-            last_working_proxy = None
 
-        if attempt < max_retries - 1:
-            wait_time = 2 ** attempt
-            print(f"⏳ Retrying cloudnestra in {wait_time}s...")
-            time.sleep(wait_time)
+async def fetch_with_retry(label: str, url: str, headers: dict, max_retries: int = 3, use_proxy: bool = True,
+                           deadline: Deadline | None = None, hedge: bool = False,
+                           latency: LatencyTracker | None = None, raise_on_missing: bool = False) -> str | None:
+    """
+    Shared fetch loop for every upstream hop.
+    Picks a proxy per attempt, reports outcomes to the proxy pool, and leaves
+    retries, backoff and deadline handling to retry.retry_async(). Returns the
+    body on 200, None on a 4xx or when all attempts fail; 403/408/429 are
+    retried through another proxy first (TRANSIENT_CLIENT_STATUSES). Raises
+    CircuitOpen when the host's breaker refuses the call, and with
+    raise_on_missing raises TitleUnavailable on a 404/410.
+    """
+    hedges_left = HEDGE_MAX_PER_REQUEST if hedge else 0
+    hop = label.lower()
+    # Proxies that already failed this hop; retries go through a different one
+    tried: list[str] = []
+    breaker = breaker_for(url)
+    client_error = None
+
+    async def attempt_once(attempt: int, timeout: float) -> tuple[bool, str | None]:
+        nonlocal hedges_left, client_error
+        if breaker:
+            breaker.allow()
+        proxy_dict = get_random_proxy(exclude=tried) if use_proxy else None
+        proxy = proxy_dict['http'] if proxy_dict else None
+        if attempt:
+            hop_retries.inc(hop)
+        status = "error"
+        # Outcome for the host's breaker: 5xx blames the host, a failed proxy is inconclusive
+        host_ok = None
+        with span(f"{hop}.attempt", attempt=attempt + 1) as attempt_span:
+            try:
+                logger.debug("Fetching", extra={"hop": hop, "attempt": attempt + 1, "max_attempts": max_retries,
+                                                "url": url, "proxy": proxy})
+
+                started = time.monotonic()
+                if proxy and hedges_left > 0:
+                    proxy, response, failed_proxies, hedges = await hedged_call(
+                        lambda p: _async_get(url, headers, p, timeout),
+                        first=proxy,
+                        next_candidate=lambda in_use: working_proxy_pool.sample(exclude=in_use + tried),
+                        # 200 wins; other 4xx are definitive, so there's no point waiting for the other attempt
+                        accept=lambda r: r.status_code == 200 or (
+                            400 <= r.status_code < 500 and r.status_code not in TRANSIENT_CLIENT_STATUSES),
+                        delay=hedge_delay(latency),
+                        max_hedges=hedges_left,
+                    )
+                    hedges_left -= hedges
+                    if hedges:
+                        hop_hedges.inc(hop, amount=hedges)
+                        attempt_span.attrs["hedges"] = hedges
+                        logger.info("Hedged attempt answered", extra={"hop": hop, "hedges": hedges, "proxy": proxy})
+                    for failed_proxy, failure in failed_proxies:
+                        if not _is_server_error(failure):
+                            _proxy_failed(failed_proxy)
+                            tried.append(failed_proxy)
+                    if isinstance(response, Exception):
+                        raise response
+                else:
+                    response = await _async_get(url, headers, proxy, timeout)
+
+                status = str(response.status_code)
+                host_ok = response.status_code < 500
+                if response.status_code in TRANSIENT_CLIENT_STATUSES:
+                    # Most likely the proxy's IP being blocked or throttled
+                    host_ok = None if proxy else False
+                if response.status_code == 200:
+                    hop_attempts.inc(hop, status)
+                    elapsed = time.monotonic() - started
+                    logger.debug("Fetched", extra={"hop": hop, "attempt": attempt + 1, "status": response.status_code,
+                                                   "proxy": proxy, "elapsed_ms": round(elapsed * 1000, 1)})
+                    if latency is not None:
+                        latency.record(elapsed)
+                    if proxy:
+                        working_proxy_pool.record_success(proxy, elapsed)
+                        request_proxy.set(proxy)
+                    return True, response.text
+
+                logger.info("Upstream error status", extra={"hop": hop, "attempt": attempt + 1,
+                                                            "status": response.status_code, "proxy": proxy})
+
+                # Don't retry on client errors (4xx), only server errors (5xx), timeouts and transient 4xx
+                if 400 <= response.status_code < 500 and response.status_code not in TRANSIENT_CLIENT_STATUSES:
+                    hop_attempts.inc(hop, status)
+                    client_error = response.status_code
+                    return True, None
+
+            except TimeoutError:
+                status = "timeout"
+                host_ok = None if proxy else False
+                logger.info("Upstream request timed out", extra={"hop": hop, "attempt": attempt + 1, "proxy": proxy})
+            except Exception as e:
+                host_ok = None if proxy else False
+                logger.info("Upstream request failed", extra={"hop": hop, "attempt": attempt + 1, "proxy": proxy,
+                                                              "error": f"{type(e).__name__}: {e}"})
+            finally:
+                attempt_span.attrs.update(proxy=proxy, status=status)
+                if breaker:
+                    breaker.record(host_ok)
+
+        hop_attempts.inc(hop, status)
+        # The upstream answered with a server error, so the proxy did its job
+        if host_ok is not False or not proxy:
+            _proxy_failed(proxy)
+            if proxy:
+                tried.append(proxy)
+        return False, None
+
+    with span(hop, url=url) as hop_span:
+        try:
+            body = await retry_async(attempt_once, label, max_retries=max_retries, deadline=deadline)
+        except CircuitOpen:
+            hop_span.attrs["circuit_open"] = True
+            raise
+        hop_span.attrs["ok"] = body is not None
+    hop_duration.observe(hop_span.duration, hop, "ok" if body is not None else "failed")
+    if body is None and client_error in MISSING_STATUSES and raise_on_missing:
+        raise TitleUnavailable(f"{hop}_{client_error}", url)
+    return body
+
+
+async def fetch_vidsrc_embed_async(url: str, max_retries: int = 3, use_proxy: bool = True,
+                                   deadline: Deadline | None = None, raise_on_missing: bool = False) -> str | None:
+    """
+    Fetches vidsrc embed page with retry logic.
+    With HEDGE_ENABLED, a slow attempt is raced against a second proxy (see hedge.py).
+    """
+    return await fetch_with_retry("Embed", url, VIDSRC_HEADERS, max_retries, use_proxy, deadline,
+                                  hedge=HEDGE_ENABLED, latency=embed_latency, raise_on_missing=raise_on_missing)
 
-    return None
 
+async def get_cloudnestra_async(url: str, referer: str, max_retries: int = 3, use_proxy: bool = True,
+                                deadline: Deadline | None = None) -> str | None:
+    """Fetches cloudnestra page with retry logic."""
+    return await fetch_with_retry("Cloudnestra", url, cloud_nestra_headers(referer=referer),
+                                  max_retries, use_proxy, deadline)
 
-def get_cloudnestra_prorcp(url: str, referer: str, max_retries: int = 3, use_proxy: bool = True) -> str | None:
+
+async def get_cloudnestra_prorcp_async(url: str, referer: str, max_retries: int = 3, use_proxy: bool = True,
+                                       deadline: Deadline | None = None) -> str | None:
     """Fetches cloudnestra prorcp page with retry logic."""
+    return await fetch_with_retry("Prorcp", url, cloud_nestra_prorcp_headers(referer=referer),
+                                  max_retries, use_proxy, deadline)
 
-    for attempt in range(max_retries):
-        # First attempt: random proxy, retries: last proxy
-        proxy_dict = get_random_proxy(is_latest=attempt!=0) if use_proxy else None
 
-        try:
-            response = requests.get(
-                url,
-                headers=cloud_nestra_prorcp_headers(referer=referer),
-                proxies=proxy_dict,
-                impersonate="chrome120",
-                timeout=10
-            )
-
-            if response.status_code == 200:
-                print(f"✓ Prorcp fetch success")
-                global last_working_proxy
-                last_working_proxy = proxy_dict['http'] if proxy_dict else None
-                return response.text
-
-            print(f"✗ Prorcp failed with status: {response.status_code}")
-            if 400 <= response.status_code < 500:
-                return None
+def fetch_vidsrc_embed(url: str, max_retries: int = 3, use_proxy: bool = True) -> str | None:
+    """
+    Synchronous wrapper for fetch_vidsrc_embed_async().
+    Use this for standalone scripts. For FastAPI, await the async version.
+    """
+    return asyncio.run(fetch_vidsrc_embed_async(url, max_retries, use_proxy))
 
-        except TimeoutError:
-            print(f"✗ Prorcp request timed out on attempt {attempt + 1}")
-        except Exception as e:
-            print(f"✗ Prorcp error on attempt {attempt + 1}: {type(e).__name__}: {e}")
+# cloudnestra_url = "https://cloudnestra.com/rcp/..."
+# referer = "https://vidsrc.xyz/embed/movie/tt5433140"
 
-        if proxy_dict and proxy_dict['http'] in working_proxy_list:
-            working_proxy_list.remove(proxy_dict['http'])
-            last_working_proxy = None
+def get_cloudnestra(url: str, referer: str, max_retries: int = 3, use_proxy: bool = True) -> str | None:
+    """Synchronous wrapper for get_cloudnestra_async()."""
+    return asyncio.run(get_cloudnestra_async(url, referer, max_retries, use_proxy))
 
-        if attempt < max_retries - 1:
-            wait_time = 2 ** attempt
-            print(f"⏳ Retrying prorcp in {wait_time}s...")
-            time.sleep(wait_time)
 
-    return None
+def get_cloudnestra_prorcp(url: str, referer: str, max_retries: int = 3, use_proxy: bool = True) -> str | None:
+    """Synchronous wrapper for get_cloudnestra_prorcp_async()."""
+    return asyncio.run(get_cloudnestra_prorcp_async(url, referer, max_retries, use_proxy))
 
 
-async def get_streaming_url(vidsrc_url: str):
+async def fetch_player_iframe_url(vidsrc_url: str, deadline: Deadline | None = None) -> str | None:
+    """
+    Hop 1: vidsrc embed page -> cloudnestra iframe URL. Caches the result.
+    Raises TitleUnavailable when vidsrc answers 404/410 or with a page without a player.
+    """
     # Step 1: Fetch initial embed page
-    print(f"Fetching vidsrc embed page: {vidsrc_url}")
-    html_content = fetch_vidsrc_embed(vidsrc_url)
+    html_content = await fetch_vidsrc_embed_async(vidsrc_url, deadline=deadline, raise_on_missing=True)
     if not html_content:
-        print("Error: Failed to fetch vidsrc embed")
+        logger.warning("Failed to fetch vidsrc embed", extra={"url": vidsrc_url})
         return None
 
     # Step 2: Extract cloudnestra URL from iframe
-    cloudnestra_url_1 = extract_player_iframe_src(html_content)
+    with span("parse", parser="player_iframe") as parse_span:
+        cloudnestra_url_1 = extract_player_iframe_src(html_content)
+    parse_duration.observe(parse_span.duration, "player_iframe")
     if not cloudnestra_url_1:
-        print("Error: Failed to extract player iframe src")
-        return None
-    print(f"Cloudnestra URL 1: {cloudnestra_url_1}")
+        logger.warning("Failed to extract player iframe src", extra={"url": vidsrc_url})
+        raise TitleUnavailable("no_player_iframe", vidsrc_url)
+    logger.debug("Found cloudnestra iframe", extra={"url": vidsrc_url, "iframe_url": cloudnestra_url_1})
+    iframe_url_cache.set(vidsrc_url, cloudnestra_url_1)
+    return cloudnestra_url_1
+
 
+async def fetch_prorcp_url(cloudnestra_url_1: str, vidsrc_url: str, deadline: Deadline | None = None) -> str | None:
+    """Hop 2: cloudnestra page -> prorcp URL. Caches the result."""
     # Step 3: Fetch cloudnestra page
-    cloudnestra_content = get_cloudnestra(cloudnestra_url_1, vidsrc_url)
+    cloudnestra_content = await get_cloudnestra_async(cloudnestra_url_1, vidsrc_url, deadline=deadline)
     if not cloudnestra_content:
-        print("Error: Failed to fetch cloudnestra content")
+        logger.warning("Failed to fetch cloudnestra content", extra={"url": cloudnestra_url_1})
         return None
 
     # Step 4: Extract prorcp URL
-    cloudnestra_url_2 = get_iframe_src(cloudnestra_content)
+    with span("parse", parser="prorcp_src") as parse_span:
+        cloudnestra_url_2 = get_iframe_src(cloudnestra_content)
+    parse_duration.observe(parse_span.duration, "prorcp_src")
     if not cloudnestra_url_2:
-        print("Error: Failed to extract iframe src from cloudnestra")
+        logger.warning("Failed to extract prorcp src from cloudnestra", extra={"url": cloudnestra_url_1})
         return None
-    print(f"Cloudnestra URL 2: {cloudnestra_url_2}")
+    logger.debug("Found prorcp URL", extra={"url": cloudnestra_url_1, "prorcp_url": cloudnestra_url_2})
+    prorcp_url_cache.set(cloudnestra_url_1, cloudnestra_url_2)
+    return cloudnestra_url_2
 
-    # Step 5: Fetch player data
-    player_data = get_cloudnestra_prorcp(cloudnestra_url_2, cloudnestra_url_1)
-    if not player_data:
-        print("Error: Failed to fetch player data")
-        return None
 
-    # Step 6: Extract streaming URLs
-    urls = extract_player_urls(player_data)
-    if not urls or len(urls) == 0:
-        print("Error: No streaming URLs found")
-        return None
+def _parse_player_urls(player_data: str) -> list[str]:
+    """Step 6: stream URLs on the player page (empty when it has none)."""
+    with span("parse", parser="player_urls") as parse_span:
+        urls = extract_player_urls(player_data)
+    parse_duration.observe(parse_span.duration, "player_urls")
+    return [url for url in urls or () if url]
+
+
+async def get_streaming_url(vidsrc_url: str, deadline: Deadline | None = None):
+    """
+    Resolves a vidsrc embed URL to stream URLs.
+    Resumes at the deepest stage whose URL is still cached. When a hop fed by a
+    cached URL fails, that URL is dropped and the previous hop is re-run.
+
+    The whole resolution shares one deadline (RESOLUTION_DEADLINE by default).
+    Each hop gets an equal share of what is left for the hops still ahead of it,
+    plus one when its input came from cache, to leave room for the fallback.
+
+    Returns None on transient failures. Raises TitleUnavailable when upstream
+    definitively doesn't have the title (see fetch_player_iframe_url()), or
+    when the player page of a freshly resolved chain lists no stream URLs; a
+    cached URL leading to such a page is dropped like one that failed.
+    """
+    deadline = deadline or Deadline(RESOLUTION_DEADLINE)
+    urls = None
+    cloudnestra_url_1 = await iframe_url_cache.aget(vidsrc_url)
+    cloudnestra_url_2 = await prorcp_url_cache.aget(cloudnestra_url_1) if cloudnestra_url_1 else None
+    event("stage_cache", resume_at="prorcp" if cloudnestra_url_2 else "cloudnestra" if cloudnestra_url_1 else "embed")
+
+    if cloudnestra_url_2:
+        logger.debug("Resuming at prorcp stage", extra={"url": vidsrc_url, "prorcp_url": cloudnestra_url_2})
+        player_data = await get_cloudnestra_prorcp_async(cloudnestra_url_2, cloudnestra_url_1,
+                                                         deadline=deadline.for_hop(2))
+        # A stale URL can also answer 200 with a page without streams (e.g. an expired token)
+        urls = _parse_player_urls(player_data) if player_data else None
+        if not urls:
+            logger.info("Cached prorcp URL failed, falling back to cloudnestra stage", extra={"url": vidsrc_url})
+            prorcp_url_cache.invalidate(cloudnestra_url_1)
+
+    if not urls and cloudnestra_url_1:
+        if not cloudnestra_url_2:
+            logger.debug("Resuming at cloudnestra stage", extra={"url": vidsrc_url, "iframe_url": cloudnestra_url_1})
+        cloudnestra_url_2 = await fetch_prorcp_url(cloudnestra_url_1, vidsrc_url, deadline=deadline.for_hop(3))
+        if not cloudnestra_url_2:
+            logger.info("Cached cloudnestra URL failed, falling back to embed stage", extra={"url": vidsrc_url})
+            iframe_url_cache.invalidate(vidsrc_url)
+        else:
+            # Step 5: Fetch player data
+            player_data = await get_cloudnestra_prorcp_async(cloudnestra_url_2, cloudnestra_url_1,
+                                                             deadline=deadline.for_hop(1))
+            if not player_data:
+                logger.warning("Failed to fetch player data", extra={"url": cloudnestra_url_2})
+                return None
+            urls = _parse_player_urls(player_data)
+            if not urls:
+                logger.info("No streams behind cached cloudnestra URL, falling back to embed stage",
+                            extra={"url": vidsrc_url})
+                prorcp_url_cache.invalidate(cloudnestra_url_1)
+                iframe_url_cache.invalidate(vidsrc_url)
+
+    if not urls:
+        if deadline.expired():
+            logger.warning("Resolution deadline reached", extra={"url": vidsrc_url})
+            return None
+
+        cloudnestra_url_1 = await fetch_player_iframe_url(vidsrc_url, deadline=deadline.for_hop(3))
+        if not cloudnestra_url_1:
+            return None
+
+        cloudnestra_url_2 = await fetch_prorcp_url(cloudnestra_url_1, vidsrc_url, deadline=deadline.for_hop(2))
+        if not cloudnestra_url_2:
+            return None
+
+        # Step 5: Fetch player data
+        player_data = await get_cloudnestra_prorcp_async(cloudnestra_url_2, cloudnestra_url_1,
+                                                         deadline=deadline.for_hop(1))
+        if not player_data:
+            logger.warning("Failed to fetch player data", extra={"url": cloudnestra_url_2})
+            return None
+
+        # Step 6: Extract streaming URLs. Only a freshly resolved chain proves the title has none.
+        urls = _parse_player_urls(player_data)
+        if not urls:
+            logger.warning("No streaming URLs found", extra={"url": cloudnestra_url_2})
+            raise TitleUnavailable("no_player_urls", vidsrc_url)
+
     video_models = []
     for url in urls:
-        if not url: continue
         origin = "https://cloudnestra.com"
         referer = "https://cloudnestra.com/"
         video_models.append(VideoModelResponse(url=url, headers=video_headers(url, origin, referer)))
@@ -230,6 +409,86 @@ class VideoModelResponse(BaseModel):
     url: str
     headers: Dict[str, str]
 
+
+# Overridable so the offline benchmark can point resolutions at its stub upstream
+VIDSRC_BASE_URL = os.getenv("VIDSRC_BASE_URL", "https://vidsrc.xyz")
+VIDSRC_EMBED_URL = VIDSRC_BASE_URL + "/embed/movie/{imdb_id}"
+
+
+
+def _dump_video_models(video_models: List[VideoModelResponse]) -> str:
+    return json.dumps([m.model_dump() for m in video_models])
+
+
+def _load_video_models(raw: str) -> List[VideoModelResponse]:
+    return [VideoModelResponse(**m) for m in json.loads(raw)]
+
+
+# Resolved stream lists keyed by IMDb id
+stream_cache = TTLCache(
+    "streams",
+    maxsize=STREAM_CACHE_MAX_SIZE,
+    default_ttl=STREAM_CACHE_TTL,
+    store=resolution_store,
+    dumps=_dump_video_models,
+    loads=_load_video_models,
+)
+
+# Intermediate stage URLs, so re-resolutions can skip hops that are still valid
+iframe_url_cache = TTLCache("iframe_urls", maxsize=STAGE_CACHE_MAX_SIZE, default_ttl=IFRAME_URL_TTL,
+                            store=resolution_store)
+prorcp_url_cache = TTLCache("prorcp_urls", maxsize=STAGE_CACHE_MAX_SIZE, default_ttl=PRORCP_URL_TTL,
+                            store=resolution_store)
+
+# IMDb ids upstream recently said it doesn't have (value: TitleUnavailable reason).
+# In-process only: entries are short-lived and crawler-driven, not worth a store write each.
+negative_cache = TTLCache("negative", maxsize=NEGATIVE_CACHE_MAX_SIZE, default_ttl=NEGATIVE_CACHE_TTL)
+
+# Concurrent requests for the same IMDb id share one resolution
+resolution_flight = SingleFlight()
+
+
+async def resolve_streaming_url(imdb_id: str, refresh: bool = False) -> List[VideoModelResponse] | None:
+    """
+    Cached front for get_streaming_url().
+    refresh=True skips the lookup and re-resolves, replacing the cached entry.
+    Titles upstream doesn't have are remembered for NEGATIVE_CACHE_TTL and
+    return None without an upstream call; transient failures aren't remembered.
+    Concurrent callers for the same id wait on a single in-flight resolution.
+    Each resolution holds an admission slot for as long as it runs, even if
+    its callers go away; raises admission.Overloaded when none frees up in time.
+    """
+    if not refresh:
+        cached = await stream_cache.aget(imdb_id)
+        event("cache", hit=cached is not None)
+        if cached is not None:
+            logger.debug("Stream cache hit", extra={"imdb_id": imdb_id})
+            return cached
+        missing = await negative_cache.aget(imdb_id)
+        event("negative_cache", hit=missing is not None, reason=missing)
+        if missing is not None:
+            logger.debug("Negative cache hit", extra={"imdb_id": imdb_id, "reason": missing})
+            return None
+
+    async def resolve():
+        try:
+            # Taken inside the shared task, so the slot is held exactly as long as the upstream work
+            async with resolution_admission.slot():
+                video_models = await get_streaming_url(VIDSRC_EMBED_URL.format(imdb_id=imdb_id))
+        except TitleUnavailable as e:
+            logger.info("Title not available upstream", extra={"imdb_id": imdb_id, "reason": e.reason})
+            negative_cache.set(imdb_id, e.reason)
+            negative_cache_stores.inc(e.reason)
+            return None
+        if video_models:
+            stream_cache.set(imdb_id, video_models, ttl=ttl_from_urls([m.url for m in video_models]))
+            negative_cache.invalidate(imdb_id)
+        return video_models
+
+    # Joining adds no upstream load, so only the resolution itself takes a slot
+    with span("resolve", imdb_id=imdb_id, joined_in_flight=resolution_flight.running(imdb_id)):
+        return await resolution_flight.do(imdb_id, resolve)
+
 if __name__ == "__main__":
     url = "https://vidsrc.xyz/embed/movie/tt5433140"
     referer = "https://vidsrc.xyz/embed/movie/tt5433140"
@@ -238,7 +497,7 @@ if __name__ == "__main__":
     cloudnestra_url_2 = get_iframe_src(get_cloudnestra(cloudnestra_url_1, referer))
     player_data= get_cloudnestra_prorcp(cloudnestra_url_2, cloudnestra_url_1)
     link= extract_player_urls(player_data)[0]
-    print(link)
+    logger.info("Resolved stream", extra={"stream_url": link})
     get_m3u8_stream(link)
 
     # Example: Using a Session with impersonate
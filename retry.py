@@ -0,0 +1,94 @@
+import asyncio
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable
+
+from tracing import span
+from logs import get_logger
+
+logger = get_logger("retry")
+
+# Overall time budget (seconds) for one resolution, split across its hops
+RESOLUTION_DEADLINE = float(os.getenv("RESOLUTION_DEADLINE", "25"))
+
+# Upper bound for a single attempt, even when the budget allows more
+ATTEMPT_TIMEOUT = float(os.getenv("ATTEMPT_TIMEOUT", "10"))
+
+# Don't start an attempt with less time than this left
+MIN_ATTEMPT_TIMEOUT = 0.5
+
+# Backoff between attempts: full jitter on base * 2**attempt, capped
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 4.0
+
+
+class Deadline:
+    """Absolute point in time (monotonic clock) by which work must finish."""
+
+    def __init__(self, seconds: float, expires_at: float | None = None):
+        self.expires_at = expires_at if expires_at is not None else time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def for_hop(self, hops_left: int) -> "Deadline":
+        """
+        Deadline for the next hop when hops_left hops (including it) remain:
+        an equal share of what is left. Time a hop doesn't use carries over.
+        """
+        share = self.remaining() / max(1, hops_left)
+        return Deadline(0, expires_at=time.monotonic() + share)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff, so concurrent retries don't line up."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+async def retry_async(
+    attempt_fn: Callable[[int, float], Awaitable[tuple[bool, Any]]],
+    label: str,
+    max_retries: int = 3,
+    deadline: Deadline | None = None,
+) -> Any:
+    """
+    Calls attempt_fn(attempt, timeout) until it reports it is finished, retrying
+    with jittered backoff. attempt_fn returns (finished, value); value is
+    returned once finished is True.
+
+    With a deadline, an attempt that may still be retried gets at most half
+    the time left, so a dead proxy timing out leaves room for another try; the
+    last attempt gets all of it. The loop gives up (returning None) as soon as
+    another attempt plus its backoff would not fit.
+    """
+    for attempt in range(max_retries):
+        timeout = ATTEMPT_TIMEOUT
+        if deadline is not None:
+            remaining = deadline.remaining()
+            if remaining < MIN_ATTEMPT_TIMEOUT:
+                logger.info("Deadline reached, giving up", extra={"hop": label.lower(), "attempts": attempt})
+                return None
+            # Keep room for one more attempt unless this is the last one
+            timeout = min(timeout, remaining / min(2, max_retries - attempt))
+
+        finished, value = await attempt_fn(attempt, timeout)
+        if finished:
+            return value
+
+        if attempt < max_retries - 1:
+            wait_time = backoff_delay(attempt)
+            if deadline is not None and deadline.remaining() - wait_time < MIN_ATTEMPT_TIMEOUT:
+                logger.info("No time left for another attempt, giving up",
+                            extra={"hop": label.lower(), "attempts": attempt + 1})
+                return None
+            logger.debug("Retrying", extra={"hop": label.lower(), "attempt": attempt + 2,
+                                            "backoff_ms": round(wait_time * 1000, 1)})
+            with span("backoff", hop=label.lower(), after_attempt=attempt + 1):
+                await asyncio.sleep(wait_time)
+
+    logger.warning("All attempts failed", extra={"hop": label.lower(), "attempts": max_retries})
+    return None
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import threading
+import time
+
+from curl_cffi import AsyncCurl, CurlMOpt
+from curl_cffi.requests import AsyncSession, Session
+
+from logs import get_logger
+
+# Browser profile every upstream request impersonates
+DEFAULT_IMPERSONATE = "chrome120"
+
+# Max concurrent connections a single session opens to one host
+MAX_CONNECTIONS_PER_HOST = int(os.getenv("SESSION_MAX_CONNECTIONS_PER_HOST", "10"))
+
+# Max in-flight requests per session
+MAX_CLIENTS_PER_SESSION = int(os.getenv("SESSION_MAX_CLIENTS", "20"))
+
+# Sessions unused for this many seconds are closed
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "120"))
+
+# How often the background task looks for idle sessions
+SESSION_EVICT_INTERVAL = float(os.getenv("SESSION_EVICT_INTERVAL", "30"))
+
+logger = get_logger("session_pool")
+
+
+class _PooledSession:
+    __slots__ = ("session", "loop", "last_used")
+
+    def __init__(self, session, loop=None):
+        self.session = session
+        self.loop = loop
+        self.last_used = time.monotonic()
+
+
+class SessionPool:
+    """
+    Keeps one long-lived curl_cffi session per (proxy, impersonation profile).
+    Reusing the session keeps TLS connections alive, so consecutive hops to
+    the same host skip the handshake.
+    """
+
+    def __init__(self, max_connections_per_host: int = MAX_CONNECTIONS_PER_HOST,
+                 max_clients: int = MAX_CLIENTS_PER_SESSION,
+                 idle_timeout: float = SESSION_IDLE_TIMEOUT):
+        self.max_connections_per_host = max_connections_per_host
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self._async_sessions: dict[tuple[str | None, str], _PooledSession] = {}
+        self._sync_sessions: dict[tuple[str | None, str], _PooledSession] = {}
+        self._lock = threading.Lock()
+
+    def get_async(self, proxy: str | None = None, impersonate: str = DEFAULT_IMPERSONATE) -> AsyncSession:
+        """Returns the AsyncSession for this proxy/profile, creating it on first use."""
+        loop = asyncio.get_running_loop()
+        key = (proxy, impersonate)
+        with self._lock:
+            pooled = self._async_sessions.get(key)
+            # Sessions are bound to the loop they were created on (asyncio.run() makes a new one)
+            if pooled is None or pooled.loop is not loop:
+                if pooled is not None:
+                    self._discard_async(pooled)
+                pooled = _PooledSession(self._new_async_session(proxy, impersonate), loop)
+                self._async_sessions[key] = pooled
+            pooled.last_used = time.monotonic()
+            return pooled.session
+
+    def get_sync(self, proxy: str | None = None, impersonate: str = DEFAULT_IMPERSONATE) -> Session:
+        """Returns the blocking Session for this proxy/profile. Curl handles are thread-local."""
+        key = (proxy, impersonate)
+        with self._lock:
+            pooled = self._sync_sessions.get(key)
+            if pooled is None:
+                session = Session(proxy=proxy, impersonate=impersonate) if proxy else Session(impersonate=impersonate)
+                pooled = _PooledSession(session)
+                self._sync_sessions[key] = pooled
+            pooled.last_used = time.monotonic()
+            return pooled.session
+
+    def _new_async_session(self, proxy: str | None, impersonate: str) -> AsyncSession:
+        async_curl = AsyncCurl()
+        async_curl.setopt(CurlMOpt.MAX_HOST_CONNECTIONS, self.max_connections_per_host)
+        kwargs = {"impersonate": impersonate}
+        if proxy:
+            kwargs["proxy"] = proxy
+        return AsyncSession(async_curl=async_curl, max_clients=self.max_clients, **kwargs)
+
+    @staticmethod
+    def _discard_async(pooled: _PooledSession):
+        # Closing needs the owning loop; if it is gone there is nothing left to release
+        if pooled.loop is not None and not pooled.loop.is_closed():
+            pooled.loop.create_task(pooled.session.close())
+
+    async def evict_idle(self) -> int:
+        """Closes sessions that have not been used for idle_timeout seconds."""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            stale_async = [k for k, p in self._async_sessions.items() if p.last_used < cutoff]
+            async_to_close = [self._async_sessions.pop(k) for k in stale_async]
+            stale_sync = [k for k, p in self._sync_sessions.items() if p.last_used < cutoff]
+            sync_to_close = [self._sync_sessions.pop(k) for k in stale_sync]
+
+        current_loop = asyncio.get_running_loop()
+        for pooled in async_to_close:
+            if pooled.loop is current_loop:
+                await pooled.session.close()
+            else:
+                self._discard_async(pooled)
+        for pooled in sync_to_close:
+            pooled.session.close()
+        return len(async_to_close) + len(sync_to_close)
+
+    async def close(self):
+        """Closes every session. Called on application shutdown."""
+        with self._lock:
+            async_to_close = list(self._async_sessions.values())
+            sync_to_close = list(self._sync_sessions.values())
+            self._async_sessions.clear()
+            self._sync_sessions.clear()
+
+        current_loop = asyncio.get_running_loop()
+        for pooled in async_to_close:
+            if pooled.loop is current_loop:
+                await pooled.session.close()
+            else:
+                self._discard_async(pooled)
+        for pooled in sync_to_close:
+            pooled.session.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "async_sessions": len(self._async_sessions),
+                "sync_sessions": len(self._sync_sessions),
+            }
+
+
+session_pool = SessionPool()
+
+
+def get_async_session(proxy: str | None = None, impersonate: str = DEFAULT_IMPERSONATE) -> AsyncSession:
+    return session_pool.get_async(proxy, impersonate)
+
+
+def get_session(proxy: str | None = None, impersonate: str = DEFAULT_IMPERSONATE) -> Session:
+    return session_pool.get_sync(proxy, impersonate)
+
+
+async def evict_idle_sessions_periodically():
+    """Closes idle sessions every SESSION_EVICT_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(SESSION_EVICT_INTERVAL)
+        evicted = await session_pool.evict_idle()
+        if evicted:
+            logger.info("Closed idle HTTP sessions", extra={"evicted": evicted})
@@ -0,0 +1,86 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from proxy import working_proxy_pool
+from requests import stream_cache, iframe_url_cache, prorcp_url_cache
+from logs import get_logger
+
+# Local file holding the warm-start snapshot. Empty disables snapshots.
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "warm_start.json")
+
+# How often (seconds) the snapshot is rewritten while running
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "60"))
+
+# Proxies not verified within this many seconds are not restored
+SNAPSHOT_PROXY_MAX_AGE = float(os.getenv("SNAPSHOT_PROXY_MAX_AGE", "3600"))
+
+SNAPSHOT_VERSION = 1
+
+logger = get_logger("snapshot")
+
+_caches = {
+    stream_cache.name: stream_cache,
+    iframe_url_cache.name: iframe_url_cache,
+    prorcp_url_cache.name: prorcp_url_cache,
+}
+
+
+def save_snapshot(path: str = SNAPSHOT_PATH):
+    """
+    Writes the healthy proxy pool and live cache entries to path (atomically).
+    Each write goes through its own temp file, so workers sharing a path
+    replace each other's snapshots whole instead of interleaving writes.
+    """
+    state = {
+        "version": SNAPSHOT_VERSION,
+        "saved_at": time.time(),
+        "proxies": working_proxy_pool.export_state(),
+        "caches": {name: cache.export_entries() for name, cache in _caches.items()},
+    }
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                    prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return len(state["proxies"])
+
+
+def load_snapshot(path: str = SNAPSHOT_PATH) -> bool:
+    """Restores a snapshot written by save_snapshot(). Returns False if there was none to load."""
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return False
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable snapshot", extra={"path": path, "error": str(e)})
+        return False
+    if state.get("version") != SNAPSHOT_VERSION:
+        logger.warning("Ignoring snapshot with unknown version", extra={"path": path, "version": state.get("version")})
+        return False
+
+    proxies = working_proxy_pool.load_state(state.get("proxies", []), max_age=SNAPSHOT_PROXY_MAX_AGE)
+    entries = 0
+    for name, cached in state.get("caches", {}).items():
+        if name in _caches:
+            entries += _caches[name].load_entries(cached)
+    age = time.time() - state.get("saved_at", 0)
+    logger.info("Warm start", extra={"proxies": proxies, "cache_entries": entries, "age_s": round(age)})
+    return True
+
+
+async def save_snapshot_periodically():
+    """Rewrites the snapshot every SNAPSHOT_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(SNAPSHOT_INTERVAL)
+        try:
+            await asyncio.to_thread(save_snapshot)
+        except Exception:
+            logger.exception("Snapshot save failed")
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from logs import get_logger
+
+# SQLite file shared by every worker on this box. Unset disables the persistent store.
+RESOLUTION_DB_PATH = os.getenv("RESOLUTION_DB_PATH", "")
+
+# How often (seconds) expired rows are purged and the WAL is checkpointed
+STORE_VACUUM_INTERVAL = float(os.getenv("STORE_VACUUM_INTERVAL", "600"))
+
+logger = get_logger("store")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace  TEXT NOT NULL,
+    key        TEXT NOT NULL,
+    value      TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_expires_at ON entries (expires_at);
+"""
+
+
+class SQLiteStore:
+    """
+    Key/value store with TTL expiry in a single SQLite file (WAL mode).
+    Several uvicorn worker processes can open the same file and read each
+    other's entries. Each thread gets its own connection.
+
+    set_later()/delete_later() queue writes on one background writer thread,
+    in order, so callers on the event loop never wait on SQLite's write lock.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="store-writer")
+        # Keys with a queued delete; reads treat them as gone until it lands
+        self._pending_deletes: dict[tuple[str, str], int] = {}
+        self.errors = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def get(self, namespace: str, key: str) -> tuple[str, float] | None:
+        """Returns (value, expires_at) for a live entry, or None."""
+        if (namespace, key) in self._pending_deletes:
+            return None
+        try:
+            row = self._connect().execute(
+                "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, key, time.time()),
+            ).fetchone()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning("Store read failed", extra={"error": str(e)})
+            return None
+        return (row[0], row[1]) if row else None
+
+    def set(self, namespace: str, key: str, value: str, ttl: float):
+        try:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, value, time.time() + ttl),
+            )
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning("Store write failed", extra={"error": str(e)})
+
+    def delete(self, namespace: str, key: str):
+        try:
+            self._connect().execute(
+                "DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+            )
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning("Store delete failed", extra={"error": str(e)})
+
+    def set_later(self, namespace: str, key: str, value: str, ttl: float):
+        """Queues set() on the writer thread."""
+        self._writer.submit(self.set, namespace, key, value, ttl)
+
+    def delete_later(self, namespace: str, key: str):
+        """Queues delete() on the writer thread."""
+        pending = (namespace, key)
+        with self._lock:
+            self._pending_deletes[pending] = self._pending_deletes.get(pending, 0) + 1
+
+        def delete():
+            try:
+                self.delete(namespace, key)
+            finally:
+                with self._lock:
+                    self._pending_deletes[pending] -= 1
+                    if not self._pending_deletes[pending]:
+                        del self._pending_deletes[pending]
+
+        self._writer.submit(delete)
+
+    def vacuum(self) -> int:
+        """Deletes expired rows and checkpoints the WAL. Returns rows removed."""
+        conn = self._connect()
+        removed = conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),)).rowcount
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return removed
+
+    def stats(self) -> dict:
+        try:
+            count = self._connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        except sqlite3.Error:
+            count = None
+        return {"path": self.path, "entries": count, "errors": self.errors}
+
+    def close(self):
+        # Let queued writes land first
+        self._writer.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+resolution_store = SQLiteStore(RESOLUTION_DB_PATH) if RESOLUTION_DB_PATH else None
+
+
+async def vacuum_store_periodically():
+    """Purges expired entries from the persistent store every STORE_VACUUM_INTERVAL seconds."""
+    while True:
+        await asyncio.sleep(STORE_VACUUM_INTERVAL)
+        try:
+            removed = await asyncio.to_thread(resolution_store.vacuum)
+            if removed:
+                logger.info("Purged expired store entries", extra={"removed": removed})
+        except sqlite3.Error as e:
+            logger.warning("Store vacuum failed", extra={"error": str(e)})
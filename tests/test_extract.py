@@ -0,0 +1,54 @@
+"""The player iframe scanner must agree with the BeautifulSoup parse it short-circuits."""
+from pathlib import Path
+
+import pytest
+from bs4 import BeautifulSoup
+
+from extract import _SCAN_MISS, _scan_player_iframe_src, extract_player_iframe_src
+
+FIXTURES = Path(__file__).resolve().parent.parent / "bench" / "fixtures"
+
+
+def bs4_player_iframe_src(html_content: str) -> str | None:
+    """The pre-scanner implementation: full html.parser tree, then find()."""
+    iframe = BeautifulSoup(html_content, "html.parser").find("iframe", id="player_iframe")
+    src_url = iframe.get("src") if iframe else None
+    if src_url and src_url.startswith("//"):
+        src_url = "https:" + src_url
+    return src_url
+
+
+CASES = {
+    "embed_fixture": (FIXTURES / "vidsrc_embed.html").read_text(),
+    "uppercase_tag": '<html><body><IFRAME ID="player_iframe" SRC="//a.example/rcp/1"></IFRAME></body></html>',
+    "single_quotes": "<iframe id='player_iframe' src='//a.example/rcp/2'></iframe>",
+    "unquoted": "<iframe id=player_iframe src=//a.example/rcp/3></iframe>",
+    "entity_in_src": '<iframe id="player_iframe" src="//a.example/rcp/4?a=1&amp;b=2"></iframe>',
+    "missing_src": '<iframe id="player_iframe" frameborder="0"></iframe>',
+    "duplicate_attr": '<iframe id="player_iframe" src="//a.example/old" src="//a.example/new"></iframe>',
+    "decoy_div_id": '<div id="player_iframe"></div><iframe id="player_iframe" src="//a.example/rcp/5"></iframe>',
+    "decoy_text": '<p>player_iframe</p><iframe id="player_iframe_2" src="//a.example/x"></iframe>'
+                  '<iframe id="player_iframe" src="//a.example/rcp/6"></iframe>',
+    "decoy_script": '<script>var id = "player_iframe";</script><iframe id="player_iframe" src="//a.example/rcp/7"></iframe>',
+    "no_player": '<iframe id="other" src="//a.example/rcp/8"></iframe>',
+    "id_only_in_text": "<p>no player_iframe here</p>",
+    "gt_in_quoted_value": '<iframe id="player_iframe" title="a > b" src="//x/rcp/1"></iframe>',
+    "gt_in_single_quoted_value": "<iframe title='a > b' id=\"player_iframe\" src='//x/rcp/2'></iframe>",
+    "id_after_tag": '<iframe src="//x/other">player_iframe</iframe><iframe id="player_iframe" src="//x/rcp/3">',
+    "unterminated_quote": '<iframe id="player_iframe" title="a src="//x/rcp/4"></iframe>',
+    "absolute_src": '<iframe id="player_iframe" src="https://a.example/rcp/9"></iframe>',
+}
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_scanner_agrees_with_beautifulsoup(name):
+    html_content = CASES[name]
+    assert extract_player_iframe_src(html_content) == bs4_player_iframe_src(html_content)
+
+
+def test_embed_fixture_takes_the_fast_path():
+    html_content = CASES["embed_fixture"]
+    src = _scan_player_iframe_src(html_content)
+    assert src is not _SCAN_MISS
+    assert "https:" + src == bs4_player_iframe_src(html_content)
+    assert src.startswith("//cloudnestra.com/rcp/")
@@ -0,0 +1,24 @@
+"""extra= keys that clash with LogRecord attributes make logging raise KeyError at the call site."""
+import ast
+from pathlib import Path
+
+from logs import _RECORD_ATTRS
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def _extra_keys():
+    for path in sorted(ROOT.glob("*.py")) + sorted((ROOT / "bench").glob("*.py")):
+        for node in ast.walk(ast.parse(path.read_text(), filename=str(path))):
+            if not isinstance(node, ast.Call):
+                continue
+            for keyword in node.keywords:
+                if keyword.arg == "extra" and isinstance(keyword.value, ast.Dict):
+                    for key in keyword.value.keys:
+                        if isinstance(key, ast.Constant):
+                            yield f"{path.name}:{key.lineno}", key.value
+
+
+def test_log_extra_keys_are_not_reserved():
+    clashes = [(where, key) for where, key in _extra_keys() if key in _RECORD_ATTRS]
+    assert clashes == []
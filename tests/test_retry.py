@@ -0,0 +1,42 @@
+"""A dead proxy timing out must leave time in the hop for a retry through another proxy."""
+import asyncio
+
+import requests
+import retry
+from proxy import ProxyPool
+from retry import Deadline
+
+DEAD, LIVE = "socks5://dead:1", "socks5://live:1"
+
+
+class _Response:
+    status_code = 200
+    text = "ok"
+
+
+def test_dead_proxy_timeout_then_success_on_another_proxy(monkeypatch):
+    pool = ProxyPool()
+    pool.add(DEAD)
+    pool.add(LIVE)
+    monkeypatch.setattr(requests, "working_proxy_pool", pool)
+    monkeypatch.setattr(retry, "backoff_delay", lambda attempt: 0.01)
+    calls = []
+
+    async def fake_get(url, headers, proxy, timeout=10):
+        calls.append(proxy)
+        if proxy == DEAD:
+            # A dead proxy never answers: the attempt burns its whole timeout
+            await asyncio.sleep(timeout)
+            raise TimeoutError
+        return _Response()
+
+    monkeypatch.setattr(requests, "_async_get", fake_get)
+
+    async def fetch():
+        # The sticky proxy from a "previous hop" makes the dead one go first
+        requests.request_proxy.set(DEAD)
+        return await requests.fetch_with_retry("Embed", "http://vidsrc.test/embed/movie/tt1", {},
+                                               deadline=Deadline(1.5))
+
+    assert asyncio.run(fetch()) == "ok"
+    assert calls == [DEAD, LIVE]
@@ -0,0 +1,105 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Allow ?debug=true to return the full per-attempt trace. Off by default: it includes proxy addresses.
+TRACE_DEBUG_ALLOWED = os.getenv("TRACE_DEBUG_ALLOWED", "0") == "1"
+
+# Server-Timing entries, in the order they are reported; each sums its spans' durations
+SERVER_TIMING_STAGES = ("queue", "embed", "cloudnestra", "prorcp", "parse", "backoff")
+
+
+class Span:
+    __slots__ = ("name", "started", "duration", "attrs")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.attrs = attrs
+
+
+class Trace:
+    """
+    Spans recorded while serving one request. Bound to the request through
+    a ContextVar, so tasks started for it (resolutions, hedges) record into
+    the same trace.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: list[Span] = []
+
+    def server_timing(self) -> str:
+        """Stage totals as a Server-Timing header value (durations in ms)."""
+        totals: dict[str, float] = {}
+        attempts: dict[str, int] = {}
+        cache = None
+        for span in self.spans:
+            if span.name in SERVER_TIMING_STAGES:
+                totals[span.name] = totals.get(span.name, 0.0) + span.duration
+            elif span.name.endswith(".attempt"):
+                hop = span.name[:-len(".attempt")]
+                attempts[hop] = attempts.get(hop, 0) + 1
+            elif span.name == "cache":
+                cache = "hit" if span.attrs.get("hit") else "miss"
+            elif span.name == "negative_cache" and span.attrs.get("hit"):
+                cache = "negative"
+            elif span.name == "resolve" and span.attrs.get("joined_in_flight"):
+                # Waited on another request's resolution; its hops aren't in this trace
+                totals["coalesced"] = span.duration
+
+        entries = []
+        if cache:
+            entries.append(f'cache;desc="{cache}"')
+        for name in SERVER_TIMING_STAGES + ("coalesced",):
+            if name in totals:
+                entry = f"{name};dur={totals[name] * 1000:.1f}"
+                if attempts.get(name, 0) > 1:
+                    entry += f';desc="{attempts[name]} attempts"'
+                entries.append(entry)
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+    def to_dict(self) -> dict:
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "spans": [
+                {
+                    "name": span.name,
+                    "start_ms": round((span.started - self.started) * 1000, 2),
+                    "duration_ms": round(span.duration * 1000, 2),
+                    **span.attrs,
+                }
+                for span in sorted(self.spans, key=lambda s: s.started)
+            ],
+        }
+
+
+# Trace of the request being served, if it is being traced
+current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """
+    Times the block as a span of the current trace. The span is yielded so
+    the block can add attributes; its duration is set even when nothing is
+    being traced, so callers can reuse it for metrics.
+    """
+    s = Span(name, attrs)
+    try:
+        yield s
+    finally:
+        s.duration = time.perf_counter() - s.started
+        trace = current_trace.get()
+        if trace is not None:
+            trace.spans.append(s)
+
+
+def event(name: str, **attrs):
+    """Records a zero-duration span (e.g. a cache lookup) on the current trace."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.spans.append(Span(name, attrs))